@@ -1,109 +1,224 @@
-from PyQt5.QtChart import QChartView, QChart, QLineSeries, QValueAxis, QScatterSeries, QSplineSeries
+from PyQt5.QtChart import QChartView, QChart, QLineSeries, QValueAxis
 from PyQt5.QtGui import QColor, QBrush, QPen
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QPointF
 import numpy as np
-from scipy.signal import find_peaks
+
+import instrumentation
 
 whiteBrush = QBrush(QColor("white"))
 blackBrush = QBrush(QColor("black"))
 
-class TripplePlot(QChartView):
-
-    def __init__(self, title, xTitle, yTitle, *args, **kwargs):
+# Points per series handed to Qt, about two per horizontal pixel of a full-width chart
+DISPLAY_POINTS = 2000
+
+#############################################
+##              Decimation                 ##
+#############################################
+def minMaxDecimate(xList, yList, maxPoints=DISPLAY_POINTS):
+    # Keeps the min and max of each bucket so spikes (the hit) survive the reduction
+    xList = np.asarray(xList, dtype=float)
+    yList = np.asarray(yList, dtype=float)
+    length = min(len(xList), len(yList))
+    if (length <= maxPoints):
+        return xList[:length], yList[:length]
+
+    binSize = int(np.ceil(length/(maxPoints//2)))
+    binned = length//binSize*binSize
+    bins = yList[:binned].reshape(-1, binSize)
+    offsets = np.arange(0, binned, binSize)
+
+    indexs = [offsets + bins.argmin(axis=1), offsets + bins.argmax(axis=1), [0, length-1]]
+    if (binned < length):
+        tail = yList[binned:length]
+        indexs.append([binned + tail.argmin(), binned + tail.argmax()])
+
+    indexs = np.unique(np.concatenate(indexs))
+    return xList[indexs], yList[indexs]
+
+def toPoints(xList, yList):
+    return [QPointF(x, y) for x, y in zip(np.asarray(xList, dtype=float).tolist(), np.asarray(yList, dtype=float).tolist())]
+
+def createAxis(title, tickCount):
+    axis = QValueAxis()
+    axis.setTitleText(title)
+    axis.setTitleBrush(whiteBrush)
+    axis.setLabelsBrush(whiteBrush)
+    axis.setGridLineVisible(False)
+    axis.setTickCount(tickCount)
+    return axis
+
+def createSeries(color, width):
+    series = QLineSeries()
+    series.setPen(QPen(QColor(color), width))
+    return series
+
+class PlotView(QChartView):
+    # Chart, axes and series are created once, every redraw only swaps the point data
+
+    def __init__(self, title, xTitle, yTitle, seriesStyles, hitWidth, *args, decimate=minMaxDecimate, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.title = title
         self.xTitle = xTitle
         self.yTitle = yTitle
+        self.decimate = decimate
 
         self.trippleChart = QChart()
         self.trippleChart.setTitle(self.title)
         self.trippleChart.setTitleBrush(whiteBrush)
         self.trippleChart.setBackgroundBrush(blackBrush)
+        self.trippleChart.legend().hide()
+
+        self.axisX = createAxis(self.xTitle, 11)
+        self.trippleChart.addAxis(self.axisX, Qt.AlignBottom)
+
+        self.axisY = createAxis(self.yTitle, 9)
+        self.trippleChart.addAxis(self.axisY, Qt.AlignLeft)
+
+        self.dataSeries = [createSeries(color, width) for color, width in seriesStyles]
+        self.hitSeries = createSeries("White", hitWidth)
+
+        for series in self.dataSeries + [self.hitSeries]:
+            self.trippleChart.addSeries(series)
+            series.attachAxis(self.axisX)
+            series.attachAxis(self.axisY)
+
+        self.timeList = np.empty(0)
+        self.hitRange = (0, 0)
+
         self.setChart(self.trippleChart)
 
     def clear(self):
-        self.trippleChart = QChart()
-        self.trippleChart.setTitleBrush(whiteBrush)
-        self.trippleChart.setTitle(self.title)
+        for series in self.dataSeries + [self.hitSeries]:
+            series.clear()
 
-        self.trippleChart.legend().hide()
+    def setSeries(self, timeList, plotLists, minY, maxY, hitTime):
+        with instrumentation.span('TripplePlot.setSeries'):
+            for series, values in zip(self.dataSeries, plotLists):
+                points = toPoints(*self.decimate(timeList, values))
+                series.replace(points)
+                instrumentation.count('plot.points', len(points))
 
-        self.trippleChart.setBackgroundBrush(blackBrush)
+        self.timeList = timeList
+        self.hitRange = (minY, maxY)
+        self.hitSeries.replace([QPointF(hitTime, maxY), QPointF(hitTime, minY)])
 
-    def plot(self, timeList, plotLists, peakIndex):
-        self.clear()
+        self.axisX.setRange(timeList[0], timeList[-1])
+        self.axisY.setRange(minY, maxY)
 
-        xSeries = QSplineSeries()
-        xSeries.setPen(QPen(QColor("Red"), 1))
+    def moveHit(self, peakIndex):
+        # Only the hit line moves, the data series and axes are left untouched
+        minY, maxY = self.hitRange
+        hitTime = self.timeList[peakIndex]
+        self.hitSeries.replace([QPointF(hitTime, maxY), QPointF(hitTime, minY)])
+
+class TripplePlot(PlotView):
+
+    def __init__(self, title, xTitle, yTitle, *args, **kwargs):
+        super().__init__(title, xTitle, yTitle, [("White", 2), ("Red", 1), ("Green", 1), ("Blue", 1)], 2, *args, **kwargs)
 
-        ySeries = QSplineSeries()
-        ySeries.setPen(QPen(QColor("Green"), 1))
+    def plot(self, timeList, plotLists, peakIndex):
+        xList, yList, zList = (np.asarray(i, dtype=float) for i in plotLists[:3])
+        magList = np.asarray(plotLists[3], dtype=float) if len(plotLists) > 3 else np.sqrt(xList**2 + yList**2 + zList**2)
 
-        zSeries = QSplineSeries()
-        zSeries.setPen(QPen(QColor("Blue"), 1))
+        length = min(len(timeList), len(xList), len(yList), len(zList), len(magList))
+        timeList = np.asarray(timeList, dtype=float)[:length]
+        seriesLists = [magList[:length], xList[:length], yList[:length], zList[:length]]
 
-        magSeries = QSplineSeries()
-        magSeries.setPen(QPen(QColor("White"), 2))
+        maxY = max(i.max() for i in seriesLists)
+        minY = min(i.min() for i in seriesLists)
 
-        hitSeries = QLineSeries()
-        hitSeries.setPen(QPen(QColor("White"), 2))
+        self.setSeries(timeList, seriesLists, minY-0.1*(maxY-minY), maxY+0.1*(maxY-minY), timeList[peakIndex])
 
-        magList = [np.sqrt(x*x+y*y+z*z) for x,y,z in zip(plotLists[0], plotLists[1], plotLists[2])]
+class SinglePlot(PlotView):
 
-        length = min(len(timeList), len(plotLists[0]), len(plotLists[1]), len(plotLists[2]), len(magList))
+    def __init__(self, title, xTitle, yTitle, *args, **kwargs):
+        super().__init__(title, xTitle, yTitle, [("Red", 1)], 1, *args, **kwargs)
 
-        maxY = max(max(plotLists[0]), max(plotLists[1]), max(plotLists[2]), max(magList))
-        minY = min(min(plotLists[0]), min(plotLists[1]), min(plotLists[2]), min(magList))
+    def plot(self, timeList, values, peakIndex):
+        values = np.asarray(values, dtype=float)
+        length = min(len(timeList), len(values))
+        timeList = np.asarray(timeList, dtype=float)[:length]
 
-        axisX = QValueAxis()
-        axisX.setTitleText(self.xTitle)
-        axisX.setTitleBrush(whiteBrush)
-        axisX.setLabelsBrush(whiteBrush)
-        axisX.setGridLineVisible(False)
-        axisX.setTickCount(11)
-        self.trippleChart.addAxis(axisX, Qt.AlignBottom)
+        maxY = values.max() + 0.1*(values.max()-values.min())
 
-        axisY = QValueAxis()
-        axisY.setTitleText(self.yTitle)
-        axisY.setTitleBrush(whiteBrush)
-        axisY.setLabelsBrush(whiteBrush)
-        axisY.setGridLineVisible(False)
-        axisY.setTickCount(9)
-        self.trippleChart.addAxis(axisY, Qt.AlignLeft)
+        self.setSeries(timeList, [values[:length]], 0, maxY, timeList[peakIndex])
 
-        hitSeries.append(timeList[peakIndex], maxY+0.1*(maxY-minY))
-        hitSeries.append(timeList[peakIndex], minY-0.1*(maxY-minY))
+class OverlayPlot(QChartView):
+    # Any number of traces over a shared x axis. Series are kept between plots and only grow in number,
+    # the ones a plot does not need are emptied rather than removed
 
-        for index in range(length):
-            xSeries.append(timeList[index], plotLists[0][index])
-            ySeries.append(timeList[index], plotLists[1][index])
-            zSeries.append(timeList[index], plotLists[2][index])
-            magSeries.append(timeList[index], magList[index])
+    def __init__(self, title, xTitle, yTitle, *args, **kwargs):
+        super().__init__(*args, **kwargs)
 
-        self.trippleChart.addSeries(magSeries)
-        self.trippleChart.addSeries(xSeries)
-        self.trippleChart.addSeries(ySeries)
-        self.trippleChart.addSeries(zSeries)
-        self.trippleChart.addSeries(hitSeries)
+        self.overlayChart = QChart()
+        self.overlayChart.setTitle(title)
+        self.overlayChart.setTitleBrush(whiteBrush)
+        self.overlayChart.setBackgroundBrush(blackBrush)
+        self.overlayChart.legend().hide()
 
-        xSeries.attachAxis(axisX)
-        xSeries.attachAxis(axisY)
+        self.axisX = createAxis(xTitle, 11)
+        self.overlayChart.addAxis(self.axisX, Qt.AlignBottom)
 
-        ySeries.attachAxis(axisX)
-        ySeries.attachAxis(axisY)
+        self.axisY = createAxis(yTitle, 9)
+        self.overlayChart.addAxis(self.axisY, Qt.AlignLeft)
 
-        zSeries.attachAxis(axisX)
-        zSeries.attachAxis(axisY)
+        self.hitSeries = createSeries("White", 1)
+        self.overlayChart.addSeries(self.hitSeries)
+        self.hitSeries.attachAxis(self.axisX)
+        self.hitSeries.attachAxis(self.axisY)
 
-        magSeries.attachAxis(axisX)
-        magSeries.attachAxis(axisY)
+        self.dataSeries = []
 
-        hitSeries.attachAxis(axisX)
-        hitSeries.attachAxis(axisY)
+        self.setChart(self.overlayChart)
 
-        axisY.setMax(maxY+0.1*(maxY-minY))
-        axisY.setMin(minY-0.1*(maxY-minY))
+    def setTitle(self, title, yTitle):
+        self.overlayChart.setTitle(title)
+        self.axisY.setTitleText(yTitle)
 
-        self.trippleChart.legend().update()
-        self.setChart(self.trippleChart)
+    def clear(self):
+        for series in self.dataSeries + [self.hitSeries]:
+            series.clear()
+
+    def traceSeries(self, index, color):
+        if (index == len(self.dataSeries)):
+            series = createSeries(color, 1)
+            self.overlayChart.addSeries(series)
+            series.attachAxis(self.axisX)
+            series.attachAxis(self.axisY)
+            self.dataSeries.append(series)
+
+        series = self.dataSeries[index]
+        series.setColor(QColor(color))
+        return series
+
+    def plot(self, xList, traces, colors, hitX=0):
+        # NaN marks samples outside a swing's window, those are left out of the line
+        xList = np.asarray(xList, dtype=float)
+        minY, maxY = np.inf, -np.inf
+        used = 0
+        with instrumentation.span('OverlayPlot.plot'):
+            for values, color in zip(traces, colors):
+                values = np.asarray(values, dtype=float)
+                finite = np.isfinite(values)
+                if (not finite.any()):
+                    continue
+
+                self.traceSeries(used, color).replace(toPoints(xList[finite], values[finite]))
+                used += 1
+
+                minY = min(minY, values[finite].min())
+                maxY = max(maxY, values[finite].max())
+                instrumentation.count('plot.points', int(finite.sum()))
+
+        for series in self.dataSeries[used:]:
+            series.clear()
+        if (not used):
+            self.hitSeries.clear()
+            return
+
+        margin = 0.1*(maxY-minY) or 1
+        self.hitSeries.replace([QPointF(hitX, maxY+margin), QPointF(hitX, minY-margin)])
+
+        self.axisX.setRange(xList[0], xList[-1])
+        self.axisY.setRange(minY-margin, maxY+margin)
@@ -1,79 +1,144 @@
-from PyQt5.QtCore import QObject, QThreadPool, pyqtSignal, pyqtSlot
-from PyQt5.QtGui import QPixmap
-from PIL.ImageQt import ImageQt
-from PIL import Image
+from PyQt5.QtCore import QObject, QTimer, Qt
+from PyQt5.QtGui import QPixmap, QImage
 import time
+import math
+import itertools
+import numpy as np
 
-from threadWorker import WorkerSignals, Worker
+# Milliseconds between animation frames
+FRAME_DELAY = 98
 
-class Clock(QObject):
+#############################################
+##             Frame scheduler             ##
+#############################################
+class FrameScheduler(QObject):
+    # One GUI thread timer drives whichever animation is playing. Frames are due at fixed
+    # times from the start of playback, so a late tick skips ahead instead of drifting.
 
-    clockTick = pyqtSignal(int)
-
-    def __init__(self, delay, start, end):
+    def __init__(self, delay=FRAME_DELAY):
         QObject.__init__(self)
 
         self.delay = delay
-        self.start = start
-        self.end = end
+        self.animation = None
+        self.droppedFrames = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+
+    def play(self, animation, start, end):
+        if (self.animation is not None):
+            self.stop()
+
+        self.animation = animation
+        self.startFrame = start
+        self.endFrame = end
+        self.lastFrame = start-1
+        self.droppedFrames = 0
+        self.startTime = time.perf_counter()
+
+        self.tick()
+
+    def stop(self, animation=None):
+        if (self.animation is None or (animation is not None and animation is not self.animation)):
+            return
+
+        stopped = self.animation
+        self.animation = None
+        self.timer.stop()
+        stopped.playbackStopped()
+
+    def tick(self):
+        animation = self.animation
+        if (animation is None):
+            return
+
+        frame = min(self.startFrame + int((time.perf_counter()-self.startTime)*1000/self.delay), self.endFrame)
+
+        # A timer that fires a little early shows nothing and waits for the frame to fall due
+        if (frame > self.lastFrame):
+            self.droppedFrames += frame-self.lastFrame-1
+            self.lastFrame = frame
+
+            animation.displayFrame(frame)
+
+        # displayFrame stops playback once it wraps past the last frame
+        if (self.animation is animation):
+            nextDue = self.startTime + (self.lastFrame-self.startFrame+1)*self.delay/1000
+            self.timer.start(max(math.ceil((nextDue-time.perf_counter())*1000), 0))
 
-    def startTick(self):
-        self.tick  = True
-        tick = self.start
-        while ((tick <= self.end) and self.tick):
-            self.clockTick.emit(tick)
-            time.sleep(self.delay/1000)
-            tick += 1
+def frameToQImage(frame):
+    # Wraps an (H,W,3) uint8 buffer without copying, the array must outlive the QImage
+    frame = np.ascontiguousarray(frame, dtype=np.uint8)
+    height, width = frame.shape[:2]
+    return QImage(frame.data, width, height, frame.strides[0], QImage.Format_RGB888), frame
 
-        if (self.tick):
-            self.clockTick.emit(0)
+frameScheduler = None
 
-    def stopTick(self):
-        self.tick = False
+def sharedScheduler():
+    global frameScheduler
 
+    # Created on first use so the timer lives on the GUI thread of a running QApplication
+    if (frameScheduler is None):
+        frameScheduler = FrameScheduler()
+
+    return frameScheduler
+
+
+animationKeys = itertools.count()
 
 class Animation(QObject):
+    # Frames live in the shared FrameCache, only the one on screen is held as a pixmap
 
-    def __init__(self, imageDisplay, frameDisplay, playButton):
+    def __init__(self, imageDisplay, frameDisplay, playButton, frameCache, scheduler=None):
         QObject.__init__(self)
 
         self.imageDisplay = imageDisplay
         self.frameDisplay = frameDisplay
         self.playButton = playButton
+        self.frameCache = frameCache
+        self.scheduler = scheduler
 
-        self.pixmaps = []
+        self.key = f'swing{next(animationKeys)}'
         self.frameNum = 0
         self.playStopToggle = True
+        self.complete = False
 
-        self.threadpool = QThreadPool()
-        self.clock = Clock(98, 0, 0)
-        self.clock.clockTick.connect(self.displayFrame)
+    def frameCount(self):
+        return self.frameCache.frameCount(self.key)
 
-    def openGif(self, gifFilename):
-        self.pixmaps = []
+    def clear(self):
+        self.stop()
+        self.frameCache.discard(self.key)
         self.frameNum = 0
         self.playStopToggle = True
-        self.playButton.setText('Play')
+        self.complete = False
+
+    def storeFrames(self, frames):
+        # Generator, safe to drain on a worker thread
+        return self.frameCache.storeFrames(self.key, frames)
+
+    def iterFrames(self):
+        return self.frameCache.iterFrames(self.key)
 
-        with Image.open(gifFilename) as im:
-            for i in range(im.n_frames):
-                im.seek(i)
-                frame = Image.new('RGBA', im.size)
-                frame.paste(im, (0,0), im.convert('RGBA'))
-                self.pixmaps.append(QPixmap.fromImage(ImageQt(frame)))
+    def framePixmap(self, frameNum):
+        # Cached uint8 frames go straight to a QImage over the same buffer, then to the display pixmap
+        image, frame = frameToQImage(self.frameCache.getFrame(self.key, frameNum))
+        return QPixmap.fromImage(image)
 
     def displayFrame(self, frameNum):
         self.frameNum = frameNum
         if (frameNum < 0):
-            self.frameNum = len(self.pixmaps)-1
+            self.frameNum = self.frameCount()-1
 
-        if (frameNum == len(self.pixmaps)):
+        if (frameNum == self.frameCount()):
             self.frameNum = 0
             if (not self.playStopToggle):
                 self.togglePlay()
 
-        self.imageDisplay.setPixmap(self.pixmaps[self.frameNum])
-        self.frameDisplay.setText(f'{self.frameNum+1}:{len(self.pixmaps)}')
+        self.imageDisplay.setPixmap(self.framePixmap(self.frameNum))
+        self.frameDisplay.setText(f'{self.frameNum+1}:{self.frameCount()}')
 
     def displayNextFrame(self):
         self.displayFrame(self.frameNum+1)
@@ -85,21 +150,22 @@ class Animation(QObject):
         self.displayFrame(0)
 
     def displayLastFrame(self):
-        self.displayFrame(len(self.pixmaps)-1)
+        self.displayFrame(self.frameCount()-1)
 
     def togglePlay(self):
+        scheduler = self.scheduler or sharedScheduler()
         if (self.playStopToggle):
-            self.clock.start = self.frameNum
-            self.clock.end = len(self.pixmaps)
-            worker = Worker(self.clock.startTick)
-            self.threadpool.start(worker)
-
             self.playButton.setText('Stop')
             self.playStopToggle = False
-        else:
-            self.clock.stopTick()
 
-            self.playButton.setText('Play')
-            self.playStopToggle = True
+            scheduler.play(self, self.frameNum, self.frameCount())
+        else:
+            scheduler.stop(self)
 
+    def stop(self):
+        if (not self.playStopToggle):
+            (self.scheduler or sharedScheduler()).stop(self)
 
+    def playbackStopped(self):
+        self.playButton.setText('Play')
+        self.playStopToggle = True
@@ -0,0 +1,142 @@
+import os
+import sys
+import argparse
+import numpy as np
+from multiprocessing import Pool
+
+from positionTrack import QCompFilter
+from sessionIO import loadSession, timeBase
+from sessionLibrary import SessionLibrary, summarizeSwings
+from swingAnalysis import swingDetection, yawSpeedFromMatrix, swingAngleFromMatrix, A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO
+
+METRIC_COLUMNS = ["session", "swing", "peakTime", "maxYawSpeed", "speedAtHit", "angleAtHit"]
+
+#############################################
+##        Headless session pipeline        ##
+#############################################
+# CSV load -> swingDetection -> QCompFilter -> yaw / swing angle metrics -> optional render.
+# Nothing here imports PyQt5, so it runs on machines without a display.
+
+def findSessions(paths, recursive=False):
+    sessions = []
+    for path in paths:
+        if (os.path.isdir(path)):
+            if (recursive):
+                for root, _, files in os.walk(path):
+                    sessions += [os.path.join(root, name) for name in sorted(files) if name.lower().endswith('.csv')]
+            else:
+                sessions += [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith('.csv')]
+        else:
+            sessions.append(path)
+
+    return sessions
+
+def processSession(filepath, shoulderWidth=40.0, useCache=True, renderDirectory=None, renderBackend="numpy", objFile="axis.obj", resampleHz=None, libraryDirectory=None):
+    session = loadSession(filepath, useCache=useCache)
+    if (len(session['timestamp']) < 2):
+        return []
+
+    session, timeInfo = timeBase(session, resampleHz is not None, resampleHz)
+    dt = timeInfo['dt']
+    if (timeInfo['wraps'] or timeInfo['dropouts']):
+        print(f'{filepath}: {timeInfo["wraps"]} timestamp wraparounds, {len(timeInfo["dropouts"])} dropouts', file=sys.stderr)
+
+    accelList, gyroList, timeList, peakList = swingDetection([session['accelX'], session['accelY'], session['accelZ']],
+                                                             [session['gyroX'], session['gyroY'], session['gyroZ']],
+                                                             session['time'], dt)
+
+    filterObject = QCompFilter(A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO, False)
+    renderObject = None
+
+    yawSpeeds = []
+    swingAngles = []
+    for swing in range(len(timeList)):
+        rotations = filterObject.applyData(timeList[swing], accelList[swing], gyroList[swing], dt)
+        yawSpeeds.append(yawSpeedFromMatrix(rotations, timeList[swing], shoulderWidth, dt))
+        swingAngles.append(swingAngleFromMatrix(rotations, np.array([[1],[0],[0]])))
+        peak = peakList[swing]
+
+        if (renderDirectory is not None and peak > 0):
+            from render import Obj_Renderer, saveGif
+
+            if (renderObject is None):
+                renderObject = Obj_Renderer(objFile, processes=0, backend=renderBackend)
+
+            name = os.path.splitext(os.path.basename(filepath))[0]
+            saveGif(renderObject.render_frames(rotations[:peak]), os.path.join(renderDirectory, f'{name}_swing{swing+1}.gif'))
+
+    summary = summarizeSwings(timeList, accelList, gyroList, peakList, yawSpeeds, swingAngles)
+    if (libraryDirectory is not None):
+        # One entry file per recording, so pool workers never write the same file
+        SessionLibrary(libraryDirectory).add(filepath, summary, shoulderWidth)
+
+    return [dict({"session": filepath, "swing": swing+1}, **{name: float(summary[name][swing]) for name in METRIC_COLUMNS[2:]})
+            for swing in range(len(timeList))]
+
+def processSessionJob(args):
+    filepath, options = args
+    try:
+        return processSession(filepath, **options), None
+    except Exception as e:
+        return [], f'{filepath}: {e}'
+
+def writeMetrics(rows, outputFile):
+    columns = {name: [row[name] for row in rows] for name in METRIC_COLUMNS}
+    extension = os.path.splitext(outputFile)[1].lower()
+
+    if (extension == '.npz'):
+        np.savez(outputFile, **{name: np.asarray(values) for name, values in columns.items()})
+    else:
+        import pandas as pd
+
+        df = pd.DataFrame(columns, columns=METRIC_COLUMNS)
+        if (extension == '.parquet'):
+            df.to_parquet(outputFile, index=False)
+        else:
+            df.to_csv(outputFile, index=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process golf swing recordings without the GUI.")
+    parser.add_argument('paths', nargs='+', help="CSV recordings or directories of recordings")
+    parser.add_argument('-o', '--output', default='metrics.npz', help="per-swing metrics file (.npz, .parquet or .csv)")
+    parser.add_argument('-j', '--processes', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('-r', '--recursive', action='store_true', help="search directories recursively")
+    parser.add_argument('--shoulder-width', type=float, default=40.0)
+    parser.add_argument('--no-cache', action='store_true', help="do not read or write the binary session cache")
+    parser.add_argument('--render', metavar='DIR', default=None, help="also render each swing to a GIF in DIR")
+    parser.add_argument('--render-backend', default='numpy', choices=['numpy', 'pytorch3d'])
+    parser.add_argument('--library', metavar='DIR', default=None, help="also store each session's swing summaries in the library at DIR")
+    parser.add_argument('--resample', metavar='HZ', type=float, default=None, help="resample onto a uniform grid at HZ (0: median sample spacing)")
+    parser.add_argument('--obj', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'axis.obj'))
+    args = parser.parse_args(argv)
+
+    sessions = findSessions(args.paths, args.recursive)
+    if (args.render is not None):
+        os.makedirs(args.render, exist_ok=True)
+
+    options = {"shoulderWidth": args.shoulder_width,
+               "useCache": not args.no_cache,
+               "renderDirectory": args.render,
+               "renderBackend": args.render_backend,
+               "objFile": args.obj,
+               "resampleHz": args.resample,
+               "libraryDirectory": args.library}
+
+    rows = []
+    failed = 0
+    with Pool(args.processes) as pool:
+        for index, (sessionRows, error) in enumerate(pool.imap(processSessionJob, [(filepath, options) for filepath in sessions])):
+            if (error is not None):
+                failed += 1
+                print(f'[{index+1}/{len(sessions)}] failed {error}', file=sys.stderr)
+            else:
+                print(f'[{index+1}/{len(sessions)}] {sessions[index]}: {len(sessionRows)} swings')
+            rows += sessionRows
+
+    writeMetrics(rows, args.output)
+    print(f'{len(rows)} swings from {len(sessions)-failed} sessions written to {args.output}')
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import numpy as np
+
+from sessionIO import COLUMNS, TICK_SECONDS, readCsv, loadSession, ticksToSeconds
+from swingAnalysis import warmImports, swingDetection, yawSpeedFromMatrix, swingAngleFromMatrix, A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO
+from positionTrack import QCompFilter
+
+# swingDetection keeps peaks at least 5 s apart, synthetic swings are spaced wider than that
+SWING_SPACING = 6.0
+
+#############################################
+##          Synthetic IMU sessions         ##
+#############################################
+# Produces the sensor's 11 column layout: a resting sensor reading -1 g on X with Gaussian
+# noise, and for every swing a backswing / downswing rotation about Z with an impact spike.
+
+def synthesizeSession(seconds=60.0, sampleRate=1000.0, swingCount=8, noise=1.0, seed=0):
+    if (swingCount*SWING_SPACING > seconds):
+        raise Exception(f"{swingCount} swings need a session of at least {swingCount*SWING_SPACING:.0f} s")
+
+    rng = np.random.default_rng(seed)
+    length = int(seconds*sampleRate)
+    timeList = np.arange(length)/sampleRate
+
+    accel = rng.normal(0, 0.05*noise, (3, length))
+    accel[0] -= 1
+    gyro = rng.normal(0, 2*noise, (3, length))
+
+    for hitTime in np.linspace(SWING_SPACING/2, seconds-SWING_SPACING/2, swingCount):
+        backswing = np.exp(-0.5*((timeList-hitTime+0.9)/0.3)**2)
+        downswing = np.exp(-0.5*((timeList-hitTime+0.05)/0.12)**2)
+        impact = np.exp(-0.5*((timeList-hitTime)/0.01)**2)
+
+        gyro[2] += -300*backswing + 1500*downswing
+        gyro[1] += 200*downswing
+        accel[1] += 4*downswing + 12*impact
+        accel[2] += 6*impact
+
+    columns = dict.fromkeys(COLUMNS)
+    columns["timestamp"] = np.round(timeList/TICK_SECONDS) + 12345
+    columns["accelX"], columns["accelY"], columns["accelZ"] = accel
+    columns["gyroX"], columns["gyroY"], columns["gyroZ"] = gyro
+    for name in ("baselineX", "baselineY", "baselineZ", "impactLevel"):
+        columns[name] = np.zeros(length)
+
+    return columns
+
+def writeSessionCsv(columns, filepath):
+    np.savetxt(filepath, np.column_stack([columns[name] for name in COLUMNS]), delimiter=',', fmt='%.6f')
+
+#############################################
+##                  Timing                 ##
+#############################################
+def timeStage(fn, repeat=3):
+    # Best of repeat runs is the figure to compare, the mean shows the spread
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+
+    return {"best": min(times), "mean": sum(times)/len(times), "runs": times}, result
+
+def skipStage(results, name, error):
+    # Optional stages (render, Qt) are recorded as skipped when their dependencies are missing
+    results[name] = {"skipped": f'{type(error).__name__}: {error}'}
+    print(f'  {name:<22} skipped ({results[name]["skipped"]})')
+
+def runStage(results, name, fn, repeat, **info):
+    try:
+        timing, result = timeStage(fn, repeat)
+    except Exception as e:
+        skipStage(results, name, e)
+        return None
+
+    results[name] = dict(timing, **info)
+    print(f'  {name:<22} {1000*timing["best"]:10.2f} ms')
+    return result
+
+def plotApplication():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication(sys.argv[:1])
+
+def runBenchmark(seconds=60.0, sampleRate=1000.0, swingCount=8, noise=1.0, repeat=3, renderFrames=32,
+                 renderBackend="numpy", plot=True, workDirectory=None, objFile="axis.obj", kernel="auto"):
+    workDirectory = workDirectory or tempfile.mkdtemp(prefix='golfapp-bench-')
+    csvFile = os.path.join(workDirectory, f'synthetic_{int(sampleRate)}hz_{swingCount}swings_{int(seconds)}s.csv')
+    writeSessionCsv(synthesizeSession(seconds, sampleRate, swingCount, noise), csvFile)
+
+    results = {}
+    session = runStage(results, "csvIngest", lambda: readCsv(csvFile), repeat, bytes=os.path.getsize(csvFile))
+    loadSession(csvFile)
+    runStage(results, "cacheLoad", lambda: loadSession(csvFile), repeat)
+
+    timestamps = ticksToSeconds(session['timestamp'])
+    accelLists = [session['accelX'], session['accelY'], session['accelZ']]
+    gyroLists = [session['gyroX'], session['gyroY'], session['gyroZ']]
+
+    accelList, gyroList, timeList, peakList = runStage(results, "swingDetection", lambda: swingDetection(accelLists, gyroLists, timestamps), repeat)
+    results["swingDetection"]["swingsFound"] = len(timeList)
+    if (len(timeList) == 0):
+        raise Exception("No swings detected in the synthetic session")
+
+    filterObject = QCompFilter(A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO, False, kernel)
+    swingSamples = sum(len(i) for i in timeList)
+
+    # Compile (or load the cached) filter kernel outside the timed runs
+    filterObject.applyData(timeList[0], accelList[0], gyroList[0])
+
+    runStage(results, "applyData", lambda: [filterObject.applyData(timeList[i], accelList[i], gyroList[i]) for i in range(len(timeList))],
+             repeat, samples=swingSamples, kernel=filterObject.kernel)
+    rotations = runStage(results, "batchApply", lambda: filterObject.batchApply(timeList, accelList, gyroList), repeat,
+                         samples=swingSamples, kernel=filterObject.kernel)
+
+    runStage(results, "yawSpeedFromMatrix", lambda: [yawSpeedFromMatrix(rotations[i], timeList[i], 40.0) for i in range(len(timeList))], repeat)
+    runStage(results, "swingAngleFromMatrix", lambda: [swingAngleFromMatrix(rotations[i], np.array([[1],[0],[0]])) for i in range(len(timeList))], repeat)
+
+    if (renderFrames > 0):
+        try:
+            from render import Obj_Renderer
+
+            renderObject = Obj_Renderer(objFile, processes=0, backend=renderBackend)
+        except Exception as e:
+            skipStage(results, "renderImage", e)
+        else:
+            runStage(results, "renderImage", lambda: renderObject.render_image(rotations[0][:renderFrames]), repeat,
+                     frames=min(renderFrames, len(rotations[0])), backend=renderObject.backend)
+            renderObject.close()
+
+    if (plot):
+        try:
+            application = plotApplication()
+            from TripplePlot import TripplePlot
+
+            view = TripplePlot('Acceleration', 'Time(s)', 'Acceleration(g)')
+        except Exception as e:
+            skipStage(results, "tripplePlot", e)
+        else:
+            def plotSession():
+                view.plot(timestamps, accelLists, int(np.argmax(accelLists[1])))
+                application.processEvents()
+
+            runStage(results, "tripplePlot", plotSession, repeat, points=len(timestamps))
+
+    return {"parameters": {"seconds": seconds, "sampleRate": sampleRate, "swingCount": swingCount, "noise": noise,
+                           "samples": len(timestamps), "repeat": repeat},
+            "stages": results}
+
+def environment():
+    return {"python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpuCount": os.cpu_count(),
+            "time": time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each processing stage on synthetic swing sessions.")
+    parser.add_argument('-o', '--output', default='benchmark.json', help="JSON results file")
+    parser.add_argument('--seconds', type=float, default=60.0, help="session length")
+    parser.add_argument('--sample-rates', type=float, nargs='+', default=[1000.0], help="one run per sample rate (Hz)")
+    parser.add_argument('--swing-counts', type=int, nargs='+', default=[8], help="one run per swing count")
+    parser.add_argument('--noise', type=float, default=1.0, help="sensor noise scale")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--render-frames', type=int, default=32, help="frames rendered per run, 0 to skip rendering")
+    parser.add_argument('--render-backend', default='numpy', choices=['numpy', 'pytorch3d'])
+    parser.add_argument('--no-plot', action='store_true', help="skip the offscreen TripplePlot stage")
+    parser.add_argument('--kernel', default='auto', choices=['auto', 'numba', 'numpy'], help="QCompFilter recurrence kernel")
+    parser.add_argument('--obj', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'axis.obj'))
+    args = parser.parse_args(argv)
+
+    # Import costs are start-up time, not stage time
+    import pandas
+    warmImports()
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix='golfapp-bench-') as workDirectory:
+        for sampleRate in args.sample_rates:
+            for swingCount in args.swing_counts:
+                seconds = max(args.seconds, swingCount*SWING_SPACING)
+                print(f'{sampleRate:.0f} Hz, {swingCount} swings, {seconds:.0f} s')
+                runs.append(runBenchmark(seconds, sampleRate, swingCount, args.noise, args.repeat, args.render_frames,
+                                         args.render_backend, not args.no_plot, workDirectory, args.obj, args.kernel))
+
+    with open(args.output, 'w') as outputFile:
+        json.dump({"environment": environment(), "runs": runs}, outputFile, indent=2)
+    print(f'{len(runs)} runs written to {args.output}')
+
+if __name__ == "__main__":
+    main()
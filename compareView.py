@@ -0,0 +1,233 @@
+import os
+import numpy as np
+
+from PyQt5.QtWidgets import (QWidget, QHBoxLayout, QVBoxLayout, QSplitter, QListWidget, QListWidgetItem, QTableWidget,
+                             QTableWidgetItem, QPushButton, QComboBox, QCheckBox, QFileDialog, QHeaderView)
+from PyQt5.QtGui import QColor
+from PyQt5.QtCore import Qt
+
+from threadWorker import Worker
+from TripplePlot import OverlayPlot
+from sessionLibrary import TRACE_NAMES
+
+# One colour per session, swings of a session share it
+SESSION_COLORS = ["#ff5555", "#55aaff", "#55ff55", "#ffaa00", "#ff55ff", "#00ffff", "#ffff55", "#aaaaaa"]
+
+TRACE_TITLES = {"yawSpeed": ("Yaw", "Speed(m/s)"),
+                "swingAngle": ("Swing Angle", "Angle(degrees)"),
+                "accelMag": ("Accelerometer", "Acceleration(g)"),
+                "gyroMag": ("Gyroscope", "Rotational Velocity(deg/s)")}
+
+TABLE_COLUMNS = ["Session", "Swing", "Peak time(s)", "Max speed", "Speed at hit", "Angle at hit"]
+
+#############################################
+##          Multi-session comparison       ##
+#############################################
+# Everything shown here comes from the SessionLibrary summaries, opening a session only reads
+# its .swings.npz. Sessions not yet in the library are indexed on the app's thread pool.
+
+class CompareWindow(QWidget):
+
+    def __init__(self, library, startJob, directory, shoulderWidth, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setWindowFlags(self.windowFlags() | Qt.Window)
+        self.setWindowTitle('Compare Sessions')
+        self.resize(1200, 700)
+
+        self.library = library
+        self.startJob = startJob
+        self.directory = directory
+        self.shoulderWidth = shoulderWidth
+
+        self.summaries = {}
+        self.rows = []
+
+        #############################################
+        ##                 Sessions                ##
+        #############################################
+        self.sessionList = QListWidget()
+        self.sessionList.itemChanged.connect(self.sessionsChanged)
+
+        addButton = QPushButton('Add...')
+        addButton.clicked.connect(self.addSessions)
+        removeButton = QPushButton('Remove')
+        removeButton.clicked.connect(self.removeSession)
+
+        buttonLayout = QHBoxLayout()
+        buttonLayout.addWidget(addButton)
+        buttonLayout.addWidget(removeButton)
+
+        sessionLayout = QVBoxLayout()
+        sessionLayout.addWidget(self.sessionList)
+        sessionLayout.addLayout(buttonLayout)
+
+        sessionPanel = QWidget()
+        sessionPanel.setLayout(sessionLayout)
+
+        #############################################
+        ##                  Overlay                ##
+        #############################################
+        self.traceSelector = QComboBox()
+        for name in TRACE_NAMES:
+            self.traceSelector.addItem(TRACE_TITLES[name][0], name)
+        self.traceSelector.setCurrentIndex(TRACE_NAMES.index("yawSpeed"))
+        self.traceSelector.currentIndexChanged.connect(self.plotOverlay)
+
+        self.meanCheck = QCheckBox('Session means')
+        self.meanCheck.toggled.connect(self.plotOverlay)
+
+        controlLayout = QHBoxLayout()
+        controlLayout.addWidget(self.traceSelector)
+        controlLayout.addWidget(self.meanCheck)
+        controlLayout.addStretch()
+
+        self.overlayView = OverlayPlot('Yaw', 'Time from hit(s)', 'Speed(m/s)')
+
+        plotLayout = QVBoxLayout()
+        plotLayout.addLayout(controlLayout)
+        plotLayout.addWidget(self.overlayView)
+
+        plotPanel = QWidget()
+        plotPanel.setLayout(plotLayout)
+
+        #############################################
+        ##                Swing table              ##
+        #############################################
+        self.swingTable = QTableWidget(0, len(TABLE_COLUMNS))
+        self.swingTable.setHorizontalHeaderLabels(TABLE_COLUMNS)
+        self.swingTable.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.swingTable.verticalHeader().hide()
+        self.swingTable.setSortingEnabled(True)
+        self.swingTable.itemChanged.connect(self.swingsChanged)
+
+        rightSplitter = QSplitter(Qt.Vertical)
+        rightSplitter.addWidget(plotPanel)
+        rightSplitter.addWidget(self.swingTable)
+
+        splitter = QSplitter(Qt.Horizontal)
+        splitter.addWidget(sessionPanel)
+        splitter.addWidget(rightSplitter)
+        splitter.setStretchFactor(1, 3)
+
+        layout = QHBoxLayout()
+        layout.addWidget(splitter)
+        self.setLayout(layout)
+
+        self.refreshSessions()
+
+    def checkedEntries(self):
+        entries = []
+        for row in range(self.sessionList.count()):
+            item = self.sessionList.item(row)
+            if (item.checkState() == Qt.Checked):
+                entries.append(item.data(Qt.UserRole))
+        return entries
+
+    def refreshSessions(self, checked=()):
+        checked = set(checked) | set(self.checkedEntries())
+
+        self.sessionList.blockSignals(True)
+        self.sessionList.clear()
+        for entry in self.library.entries():
+            item = QListWidgetItem(f'{entry["name"]}  ({entry["swingCount"]} swings)')
+            item.setToolTip(entry["source"])
+            item.setData(Qt.UserRole, entry["entry"])
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if entry["entry"] in checked else Qt.Unchecked)
+            self.sessionList.addItem(item)
+        self.sessionList.blockSignals(False)
+
+        self.sessionsChanged()
+
+    def addSessions(self):
+        filepaths, _ = QFileDialog.getOpenFileNames(self, 'Add sessions', self.directory, 'comma seperated file (*.csv)')
+        if (not filepaths):
+            return
+
+        worker = Worker(self.library.ensureAll, filepaths, self.shoulderWidth())
+        worker.signals.result.connect(lambda failed: self.refreshSessions([self.library.entryPath(i) for i in filepaths]))
+        self.startJob(worker)
+
+    def removeSession(self):
+        item = self.sessionList.currentItem()
+        if (item is not None):
+            self.library.remove(item.data(Qt.UserRole))
+            self.refreshSessions()
+
+    def sessionsChanged(self, item=None):
+        entries = self.checkedEntries()
+        self.summaries = {entry: self.library.load(entry) for entry in entries if os.path.isfile(entry)}
+
+        # (entry, swing index, colour) per table row, the checkbox in the first column overlays it
+        self.rows = []
+        self.swingTable.blockSignals(True)
+        self.swingTable.setSortingEnabled(False)
+        self.swingTable.setRowCount(sum(summary["swingCount"] for summary in self.summaries.values()))
+
+        for sessionIndex, (entry, summary) in enumerate(self.summaries.items()):
+            color = QColor(SESSION_COLORS[sessionIndex % len(SESSION_COLORS)])
+            for swing in range(summary["swingCount"]):
+                row = len(self.rows)
+                self.rows.append((entry, swing, color))
+
+                nameItem = QTableWidgetItem(summary["name"])
+                nameItem.setFlags(nameItem.flags() | Qt.ItemIsUserCheckable)
+                nameItem.setCheckState(Qt.Checked)
+                nameItem.setForeground(color)
+                nameItem.setData(Qt.UserRole, row)
+                self.swingTable.setItem(row, 0, nameItem)
+
+                values = [swing+1] + [float(summary[name][swing]) for name in ("peakTime", "maxYawSpeed", "speedAtHit", "angleAtHit")]
+                for column, value in enumerate(values):
+                    valueItem = QTableWidgetItem()
+                    valueItem.setData(Qt.DisplayRole, value if column == 0 else round(value, 2))
+                    valueItem.setFlags(valueItem.flags() & ~Qt.ItemIsEditable)
+                    self.swingTable.setItem(row, column+1, valueItem)
+
+        self.swingTable.setSortingEnabled(True)
+        self.swingTable.blockSignals(False)
+
+        self.plotOverlay()
+
+    def swingsChanged(self, item):
+        if (item.column() == 0):
+            self.plotOverlay()
+
+    def checkedSwings(self):
+        # Table rows move when sorted, the original row is kept in the name item
+        swings = []
+        for tableRow in range(self.swingTable.rowCount()):
+            item = self.swingTable.item(tableRow, 0)
+            if (item is not None and item.checkState() == Qt.Checked):
+                swings.append(self.rows[item.data(Qt.UserRole)])
+        return swings
+
+    def plotOverlay(self):
+        name = self.traceSelector.currentData()
+        title, yTitle = TRACE_TITLES[name]
+        self.overlayView.setTitle(title, yTitle)
+
+        swings = self.checkedSwings()
+        if (not swings):
+            self.overlayView.clear()
+            return
+
+        if (self.meanCheck.isChecked()):
+            grouped = {}
+            for entry, swing, color in swings:
+                grouped.setdefault(entry, (color, []))[1].append(swing)
+
+            traces = []
+            colors = []
+            for entry, (color, indexs) in grouped.items():
+                traceRows = self.summaries[entry][name][indexs]
+                # all-NaN columns (no swing reaches that far) stay NaN without a warning
+                counts = np.isfinite(traceRows).sum(axis=0)
+                traces.append(np.where(counts > 0, np.nansum(traceRows, axis=0)/np.maximum(counts, 1), np.nan))
+                colors.append(color)
+        else:
+            traces = [self.summaries[entry][name][swing] for entry, swing, _ in swings]
+            colors = [color for _, _, color in swings]
+
+        traceTime = next(iter(self.summaries.values()))["traceTime"]
+        self.overlayView.plot(traceTime, traces, colors)
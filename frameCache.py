@@ -0,0 +1,139 @@
+import os
+import zlib
+import shutil
+import tempfile
+import threading
+import itertools
+from collections import OrderedDict
+import numpy as np
+
+# Decoded frames kept in memory across every swing, about 340 512x512 RGB frames
+FRAME_CACHE_BYTES = 256*1024**2
+
+#############################################
+##               Frame cache               ##
+#############################################
+# Every frame is zlib compressed into a per-swing spill file as it is stored, the flat
+# shaded renders shrink to a few KB each. Decoded uint8 frames live in one LRU shared by
+# all swings and are evicted oldest first once the budget is exceeded, an evicted frame
+# is decoded again from its spill file the next time it is shown.
+# storeFrames may run on a worker thread while the GUI thread reads, all state is under one lock.
+
+class FrameCache:
+    def __init__(self, budgetBytes=FRAME_CACHE_BYTES, directory=None) -> None:
+        self.budgetBytes = budgetBytes
+        self.directory = directory or tempfile.mkdtemp(prefix='golfapp-frames-')
+        self.ownDirectory = directory is None
+
+        self.lock = threading.Lock()
+        self.frames = OrderedDict()
+        self.usedBytes = 0
+        # key -> (spill path, [(offset, length)], frame shape)
+        self.spills = {}
+        self.spillCounter = itertools.count()
+
+    def spillPath(self, key):
+        # Unique per store, a discarded spill may still be open in the writer that created it
+        return os.path.join(self.directory, f'{key}.{next(self.spillCounter)}.frames')
+
+    def storeFrames(self, key, frames):
+        # Generator, passes each frame through once it is on disk and in the cache
+        self.discard(key)
+
+        path = self.spillPath(key)
+        index = []
+        with self.lock:
+            self.spills[key] = (path, index, None)
+
+        try:
+            with open(path, 'wb') as spillFile:
+                for frame in frames:
+                    frame = np.ascontiguousarray(frame, dtype=np.uint8)
+                    blob = zlib.compress(frame.data, 1)
+
+                    offset = spillFile.tell()
+                    spillFile.write(blob)
+                    spillFile.flush()
+
+                    with self.lock:
+                        if (self.spills.get(key, (None,))[0] != path):
+                            return
+                        self.spills[key] = (path, index, frame.shape)
+                        index.append((offset, len(blob)))
+                        self.insert((key, len(index)-1), frame)
+
+                    yield frame
+        finally:
+            # Discarded while being written, the open file could not be removed then
+            with self.lock:
+                discarded = self.spills.get(key, (None,))[0] != path
+            if (discarded and os.path.exists(path)):
+                os.remove(path)
+
+    def frameCount(self, key):
+        with self.lock:
+            return len(self.spills[key][1]) if key in self.spills else 0
+
+    def getFrame(self, key, index, keep=True):
+        with self.lock:
+            frame = self.frames.get((key, index))
+            if (frame is not None):
+                self.frames.move_to_end((key, index))
+                return frame
+
+            if (key not in self.spills):
+                raise Exception(f"No frames stored for {key}")
+            path, spillIndex, shape = self.spills[key]
+            offset, length = spillIndex[index]
+
+        with open(path, 'rb') as spillFile:
+            spillFile.seek(offset)
+            frame = np.frombuffer(zlib.decompress(spillFile.read(length)), dtype=np.uint8).reshape(shape)
+
+        if (keep):
+            with self.lock:
+                if (key in self.spills):
+                    self.insert((key, index), frame)
+
+        return frame
+
+    def iterFrames(self, key):
+        # Reads every frame without disturbing what is cached, for exports
+        for index in range(self.frameCount(key)):
+            yield self.getFrame(key, index, keep=False)
+
+    def insert(self, cacheKey, frame):
+        if (cacheKey in self.frames):
+            self.usedBytes -= self.frames.pop(cacheKey).nbytes
+
+        self.frames[cacheKey] = frame
+        self.usedBytes += frame.nbytes
+
+        # Always keep the newest frame, it is the one about to be shown
+        while (self.usedBytes > self.budgetBytes and len(self.frames) > 1):
+            self.usedBytes -= self.frames.popitem(last=False)[1].nbytes
+
+    def discard(self, key):
+        with self.lock:
+            spill = self.spills.pop(key, None)
+            if (spill is None):
+                return
+
+            for index in range(len(spill[1])):
+                frame = self.frames.pop((key, index), None)
+                if (frame is not None):
+                    self.usedBytes -= frame.nbytes
+
+        try:
+            os.remove(spill[0])
+        except OSError:
+            pass
+
+    def close(self):
+        with self.lock:
+            keys = list(self.spills)
+        for key in keys:
+            self.discard(key)
+
+        if (self.ownDirectory):
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import threading
+
+#############################################
+##          Spans, counters, profiler      ##
+#############################################
+# GOLFAPP_PROFILE switches instrumentation on:
+#   unset / "0"   disabled, span() hands back a shared no-op and count() returns at once
+#   "1"           timing spans and counters
+#   "cprofile"    spans and counters, plus cProfile on the GUI thread and every Worker thread
+# GOLFAPP_PROFILE_OUTPUT=<file.json> writes the stats at exit (and <file>.prof with cProfile).
+# Only this process is measured, work done inside process pools shows up as the span around it.
+
+PROFILE_MODE = os.environ.get('GOLFAPP_PROFILE', '0').strip().lower()
+ENABLED = PROFILE_MODE not in ('', '0', 'false', 'off')
+PROFILER = PROFILE_MODE == 'cprofile'
+
+lock = threading.Lock()
+spans = {}
+counters = {}
+profileStats = None
+threadProfiler = threading.local()
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name) -> None:
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        addSpan(self.name, time.perf_counter() - self.start)
+        return False
+
+def span(name):
+    if (not ENABLED):
+        return NULL_SPAN
+    return Span(name)
+
+def addSpan(name, seconds):
+    with lock:
+        stats = spans.get(name)
+        if (stats is None):
+            spans[name] = [1, seconds, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] = seconds
+
+def count(name, amount=1):
+    if (not ENABLED):
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + amount
+
+def reset():
+    global profileStats
+
+    with lock:
+        spans.clear()
+        counters.clear()
+        profileStats = None
+
+def snapshot():
+    with lock:
+        return {"spans": {name: {"count": stats[0], "total": stats[1], "mean": stats[1]/stats[0], "max": stats[2], "last": stats[3]}
+                          for name, stats in spans.items()},
+                "counters": dict(counters)}
+
+def formatStats():
+    stats = snapshot()
+    lines = [f'{"span":<32}{"count":>7}{"total ms":>12}{"mean ms":>10}{"max ms":>10}{"last ms":>10}']
+    for name, values in sorted(stats["spans"].items(), key=lambda item: -item[1]["total"]):
+        lines.append(f'{name:<32}{values["count"]:>7}{1000*values["total"]:>12.1f}{1000*values["mean"]:>10.2f}'
+                     f'{1000*values["max"]:>10.2f}{1000*values["last"]:>10.2f}')
+
+    lines.append('')
+    lines.append(f'{"counter":<32}{"value":>12}')
+    for name, value in sorted(stats["counters"].items()):
+        lines.append(f'{name:<32}{value:>12}')
+
+    return '\n'.join(lines)
+
+#############################################
+##                 cProfile                ##
+#############################################
+class Profiled:
+    # Profiles the calling thread until exit and folds the result into the shared stats.
+    # Nested uses on the same thread are no-ops.
+    def __enter__(self):
+        import cProfile
+
+        self.profiler = None
+        if (not getattr(threadProfiler, 'active', False)):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler per interpreter, the first one wins
+                return self
+
+            threadProfiler.active = True
+            self.profiler = profiler
+        return self
+
+    def __exit__(self, *exc):
+        if (self.profiler is not None):
+            self.profiler.disable()
+            threadProfiler.active = False
+            addProfile(self.profiler)
+        return False
+
+def profiled():
+    if (not PROFILER):
+        return NULL_SPAN
+    return Profiled()
+
+def addProfile(profiler):
+    global profileStats
+    import pstats
+
+    with lock:
+        if (profileStats is None):
+            profileStats = pstats.Stats(profiler)
+        else:
+            profileStats.add(profiler)
+
+mainProfiler = None
+
+def startProfiler():
+    # For the GUI thread, which never leaves its event loop to close a profiled() block
+    global mainProfiler
+
+    if (PROFILER and mainProfiler is None):
+        mainProfiler = Profiled().__enter__()
+
+def collectProfiler():
+    global mainProfiler
+
+    if (mainProfiler is not None):
+        mainProfiler.__exit__(None, None, None)
+        mainProfiler = None
+        startProfiler()
+
+#############################################
+##                  Export                 ##
+#############################################
+def exportStats(filepath):
+    collectProfiler()
+
+    with open(filepath, 'w') as statsFile:
+        json.dump(dict(snapshot(), time=time.strftime('%Y-%m-%dT%H:%M:%S'), mode=PROFILE_MODE), statsFile, indent=2)
+
+    if (profileStats is not None):
+        with lock:
+            profileStats.dump_stats(os.path.splitext(filepath)[0] + '.prof')
+
+def exportAtExit():
+    filepath = os.environ.get('GOLFAPP_PROFILE_OUTPUT')
+    if (ENABLED and filepath):
+        exportStats(filepath)
+
+if (ENABLED):
+    import atexit
+    atexit.register(exportAtExit)
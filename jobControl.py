@@ -0,0 +1,24 @@
+import threading
+
+class JobCancelled(Exception):
+    pass
+
+class CancelToken:
+    # Cooperative cancellation: long jobs call check() between units of work
+    def __init__(self) -> None:
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if (self.event.is_set()):
+            raise JobCancelled()
+
+def reportProgress(progress_callback, done, total, message):
+    if (progress_callback is not None and total > 0):
+        progress_callback(done/total, message)
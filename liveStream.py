@@ -0,0 +1,239 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+from collections import deque
+import numpy as np
+
+from positionTrack import QCompFilter, QCompFilterStream
+from sessionIO import COLUMNS, TickClock, loadSession, ticksToSeconds
+from swingAnalysis import StreamingSwingDetector, magnitude, yawSpeedFromMatrix, swingAngleFromMatrix, A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO
+
+#############################################
+##               Live sources              ##
+#############################################
+# Every source is a generator of (rows, arrivalTime): rows is an (n, 11) array in the CSV
+# column layout and arrivalTime is the time.perf_counter() at which they were read.
+# Sources end when their input ends or stopEvent is set.
+
+def parseRows(lines):
+    rows = []
+    for line in lines:
+        fields = line.split(',')
+        if (len(fields) != len(COLUMNS)):
+            continue
+        try:
+            rows.append([float(i) for i in fields])
+        except ValueError:
+            continue
+
+    return np.array(rows, dtype=float).reshape(-1, len(COLUMNS))
+
+def splitLines(pending, data):
+    lines = (pending + data).split('\n')
+    return lines[:-1], lines[-1]
+
+def socketSource(host, port, stopEvent):
+    with socket.create_connection((host, port)) as connection:
+        connection.settimeout(0.1)
+        pending = ''
+        while (not stopEvent.is_set()):
+            try:
+                data = connection.recv(65536)
+            except socket.timeout:
+                continue
+            if (not data):
+                break
+
+            lines, pending = splitLines(pending, data.decode('utf-8', errors='ignore'))
+            rows = parseRows(lines)
+            if (len(rows)):
+                yield rows, time.perf_counter()
+
+def pipeSource(stream, stopEvent):
+    stream = getattr(stream, 'buffer', stream)
+    pending = ''
+    while (not stopEvent.is_set()):
+        data = stream.read1(65536) if hasattr(stream, 'read1') else stream.readline()
+        if (not data):
+            break
+
+        lines, pending = splitLines(pending, data.decode('utf-8', errors='ignore') if isinstance(data, bytes) else data)
+        rows = parseRows(lines)
+        if (len(rows)):
+            yield rows, time.perf_counter()
+
+def tailSource(filepath, stopEvent, fromStart=False, pollTime=0.005):
+    with open(filepath, 'r', encoding='utf-8', errors='ignore') as tailFile:
+        if (not fromStart):
+            tailFile.seek(0, os.SEEK_END)
+
+        pending = ''
+        while (not stopEvent.is_set()):
+            data = tailFile.read()
+            if (not data):
+                time.sleep(pollTime)
+                continue
+
+            lines, pending = splitLines(pending, data)
+            rows = parseRows(lines)
+            if (len(rows)):
+                yield rows, time.perf_counter()
+
+def replaySource(filepath, stopEvent, speed=1.0):
+    # Plays a recorded session back at its own sample timing, the local test source
+    session = loadSession(filepath)
+    data = np.column_stack([session[name] for name in COLUMNS])
+    dueTimes = ticksToSeconds(session['timestamp'])/speed
+
+    start = time.perf_counter()
+    index = 0
+    while (index < len(data) and not stopEvent.is_set()):
+        now = time.perf_counter() - start
+        end = int(np.searchsorted(dueTimes, now, side='right'))
+        if (end > index):
+            yield data[index:end], time.perf_counter()
+            index = end
+        else:
+            time.sleep(min(0.002, dueTimes[index] - now))
+
+def openSource(spec, stopEvent, speed=1.0):
+    # "tcp://host:port", "-" for stdin, "tail:<path>" to follow a growing file, or a CSV to replay
+    if (spec.startswith('tcp://')):
+        host, port = spec[len('tcp://'):].rsplit(':', 1)
+        return socketSource(host, int(port), stopEvent)
+    if (spec == '-'):
+        return pipeSource(sys.stdin, stopEvent)
+    if (spec.startswith('tail:')):
+        return tailSource(spec[len('tail:'):], stopEvent)
+    return replaySource(spec, stopEvent, speed)
+
+#############################################
+##               Live session              ##
+#############################################
+class LiveSession:
+    # Runs the incremental filter and swing detector on each batch of samples and keeps a
+    # short display history. push() runs on the reader thread, snapshot() on the GUI thread.
+    def __init__(self, filterObject=None, historySeconds=5, shoulderWidth=40.0) -> None:
+        self.filterObject = filterObject or QCompFilter(A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO, False)
+        self.historySeconds = historySeconds
+        self.shoulderWidth = shoulderWidth
+
+        self.filterStream = QCompFilterStream(self.filterObject)
+        self.detector = StreamingSwingDetector()
+        self.lock = threading.Lock()
+
+        self.clock = TickClock()
+        # (time, rotations) per pushed batch, long enough to hold the window of a swing not yet reported
+        self.rotationHistory = deque()
+        self.history = deque()
+        self.historyLength = 0
+        self.rotation = np.eye(3)
+        self.swings = []
+        self.sampleCount = 0
+        self.latestArrival = None
+        self.processLatency = deque(maxlen=200)
+
+    def push(self, rows, arrivalTime):
+        timeArray = self.clock.seconds(rows[:, 0])
+        accelArray = rows[:, 1:4]
+        gyroArray = rows[:, 7:10]
+        accelMag = magnitude(*accelArray.T)
+
+        rotations = self.filterStream.update(timeArray, accelArray, gyroArray, accelMag)
+        self.rotationHistory.append((timeArray, rotations))
+        while (len(self.rotationHistory) > 1 and timeArray[-1] - self.rotationHistory[0][0][-1] > 2*self.detector.windowTime):
+            self.rotationHistory.popleft()
+
+        swings = [self.swingMetrics(*swing) for swing in self.detector.push(timeArray, accelArray.T, gyroArray.T)]
+
+        with self.lock:
+            self.history.append((timeArray, accelArray, gyroArray))
+            self.historyLength += len(timeArray)
+            while (len(self.history) > 1 and timeArray[-1] - self.history[0][0][-1] > self.historySeconds):
+                self.historyLength -= len(self.history.popleft()[0])
+
+            self.rotation = rotations[-1]
+            self.swings += swings
+            self.sampleCount += len(rows)
+            self.latestArrival = arrivalTime
+            self.processLatency.append(time.perf_counter() - arrivalTime)
+
+    def finish(self):
+        swings = [self.swingMetrics(*swing) for swing in self.detector.flush()]
+        with self.lock:
+            self.swings += swings
+
+    def swingMetrics(self, accel, gyro, timeList, peak):
+        # The stream has already filtered the swing's samples, its rotations are reused rather
+        # than filtering the window again from an accelerometer-only start
+        times = np.concatenate([i[0] for i in self.rotationHistory])
+        start = int(np.searchsorted(times, timeList[0]))
+        rotations = np.concatenate([i[1] for i in self.rotationHistory])[start:start+len(timeList)]
+
+        yawSpeed = yawSpeedFromMatrix(rotations, timeList, self.shoulderWidth)
+        swingAngle = swingAngleFromMatrix(rotations, np.array([[1],[0],[0]]))
+
+        return {"peakTime": float(timeList[peak]),
+                "maxYawSpeed": float(yawSpeed.max()),
+                "speedAtHit": float(yawSpeed[min(peak, len(yawSpeed)-1)]),
+                "angleAtHit": float(swingAngle[peak])}
+
+    def snapshot(self):
+        with self.lock:
+            if (not self.history):
+                return None
+
+            timeList = np.concatenate([i[0] for i in self.history])
+            accelArray = np.concatenate([i[1] for i in self.history])
+            gyroArray = np.concatenate([i[2] for i in self.history])
+
+            return {"time": timeList,
+                    "accel": list(accelArray.T) + [magnitude(*accelArray.T)],
+                    "gyro": list(gyroArray.T) + [magnitude(*gyroArray.T)],
+                    "rotation": self.rotation.copy(),
+                    "swings": list(self.swings),
+                    "sampleCount": self.sampleCount,
+                    "latestArrival": self.latestArrival,
+                    "processLatency": float(np.mean(self.processLatency)) if self.processLatency else 0.0}
+
+def runLive(source, session, stopEvent=None):
+    for rows, arrivalTime in source:
+        session.push(rows, arrivalTime)
+        if (stopEvent is not None and stopEvent.is_set()):
+            break
+    session.finish()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Track orientation and swings from a live IMU feed.")
+    parser.add_argument('source', help='tcp://host:port, "-" for stdin, tail:<file>, or a CSV to replay in real time')
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed for CSV sources")
+    parser.add_argument('--shoulder-width', type=float, default=40.0)
+    args = parser.parse_args(argv)
+
+    stopEvent = threading.Event()
+    session = LiveSession(shoulderWidth=args.shoulder_width)
+    reported = 0
+
+    try:
+        for rows, arrivalTime in openSource(args.source, stopEvent, args.speed):
+            session.push(rows, arrivalTime)
+            for swing in session.swings[reported:]:
+                print(f'swing {reported+1} at {swing["peakTime"]:.2f}s: max yaw {swing["maxYawSpeed"]:.2f}, '
+                      f'speed at hit {swing["speedAtHit"]:.2f}, angle at hit {swing["angleAtHit"]:.1f}, '
+                      f'latency {1000*(time.perf_counter()-arrivalTime):.1f} ms')
+                reported += 1
+    except KeyboardInterrupt:
+        stopEvent.set()
+
+    session.finish()
+    for swing in session.swings[reported:]:
+        reported += 1
+        print(f'swing {reported} at {swing["peakTime"]:.2f}s: max yaw {swing["maxYawSpeed"]:.2f}')
+
+    print(f'{session.sampleCount} samples, {len(session.swings)} swings, mean processing latency {1000*np.mean(session.processLatency or [0]):.2f} ms')
+
+if __name__ == "__main__":
+    main()
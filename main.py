@@ -1,86 +1,41 @@
+import time
+startTime = time.perf_counter()
+
 import sys
 import os
-import pandas as pd
+import multiprocessing
+import threading
 import numpy as np
 from PIL import Image
 from PIL.ImageQt import ImageQt
-from scipy.signal import find_peaks
-from scipy.spatial.transform import Rotation
 
 from PyQt5 import uic
-from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QLabel
-from PyQt5.QtChart import QChartView, QChart, QValueAxis, QSplineSeries, QLineSeries
-from PyQt5.QtGui import QColor, QBrush, QPen, QPixmap
-from PyQt5.QtCore import QThreadPool, Qt
+from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QLabel, QProgressBar, QDockWidget, QWidget, QPlainTextEdit, QShortcut, QInputDialog
+from PyQt5.QtGui import QPixmap, QFontDatabase, QKeySequence
+from PyQt5.QtCore import QThreadPool, QTimer, Qt
 
+import instrumentation
 from threadWorker import WorkerSignals, Worker
-from TripplePlot import TripplePlot, whiteBrush, blackBrush
-from animationObject import Animation
-from quart import Quaternion
-from positionTrack import QCompFilter
-from render import Obj_Renderer
-
-def swingDetection(accelLists, gyroLists, timeList):
-    length = min(len(accelLists[0]), len(accelLists[1]), len(accelLists[2]), len(gyroLists[0]), len(gyroLists[1]), len(gyroLists[2]), len(timeList))
-    avgTime = sum([(timeList[index] - timeList[index-1]) for index in range(1, length)])/(length-1)
-
-    indexWindow = 5/avgTime
-
-    accelMagList = [np.sqrt(accelLists[0][index]**2 + accelLists[1][index]**2 + accelLists[2][index]**2) for index in range(length)]
-    gyroMagList = [np.sqrt(gyroLists[0][index]**2 + gyroLists[1][index]**2 + gyroLists[2][index]**2) for index in range(length)]
-
-    accelHeight = max(accelMagList)*0.4
-    gyroHeight = max(gyroMagList)*0.4
-    accelPeakList, _ = find_peaks(accelMagList, prominence=1, distance=indexWindow, height=accelHeight)
-    gyroPeakList, _ = find_peaks(gyroMagList, prominence=1, distance=indexWindow, height=gyroHeight)
-
-    if len(accelPeakList) > len(gyroPeakList):
-        largerList = accelPeakList
-        smallerList = gyroPeakList
-    else:
-        largerList = gyroPeakList
-        smallerList = accelPeakList
-
-    peakList = []
-    for peak1 in smallerList:
-        nearIndexs = []
-        for peak2 in largerList:
-            if abs(peak1 - peak2) < indexWindow/2:
-                nearIndexs.append(peak2)
-        peakList.append((peak1+min(nearIndexs))/2)
-
-    newAccelList = []
-    newGyroList = []
-    newTimeList = []
-    newPeakList = []
-
-    for peakIndex in peakList:
-        windowStart = int(peakIndex-indexWindow/2)
-        windowEnd = int(peakIndex+indexWindow/2)
-
-        newAccelList.append([accelLists[0][windowStart:windowEnd],
-                             accelLists[1][windowStart:windowEnd],
-                             accelLists[2][windowStart:windowEnd],
-                             accelMagList[windowStart:windowEnd]])
-        newGyroList.append([gyroLists[0][windowStart:windowEnd],
-                            gyroLists[1][windowStart:windowEnd],
-                            gyroLists[2][windowStart:windowEnd],
-                            gyroMagList[windowStart:windowEnd]])
-        newTimeList.append(timeList[windowStart:windowEnd])
-
-        newPeakList.append(int(peakIndex-windowStart-1))
-
-    return newAccelList, newGyroList, newTimeList, newPeakList
-
-def yawSpeedFromMatrix(matrixList, timeList, shoulderWidth):
-    eularRot = [Rotation.from_matrix(matrix).as_euler('xyz', degrees=False) for matrix in matrixList]
-    return [0.005*shoulderWidth*abs((eularRot[i][1] - eularRot[i-1][1])/(timeList[i] - timeList[i-1])) for i in range(1, len(eularRot))]
-
-def swingAngleFromMatrix(matrixList, refrenceVector):
-    gVector = np.array([[0],[-1],[0]])
-    updatedGVector = [np.matmul(matrix, gVector) for matrix in matrixList]
-
-    return [np.arccos(sum([a*b for a,b in zip(refrenceVector, vector)])[0])*180/np.pi for vector in updatedGVector]
+from TripplePlot import TripplePlot, SinglePlot
+from animationObject import Animation, sharedScheduler, frameToQImage
+from frameCache import FrameCache, FRAME_CACHE_BYTES
+from render import Obj_Renderer, saveGif
+from sessionIO import loadSession, iterCsvChunks, timeBase
+from sessionLibrary import SessionLibrary, summarizeSwings
+from compareView import CompareWindow
+from swingAnalysis import QCompFilter, warmImports, swingDetection, streamSwingDetection, SwingResults, A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO
+
+# Chart/orientation refresh cap while streaming live data
+LIVE_FPS = 30
+
+# Live sources offered by the Live button: a recording replayed in real time, a TCP stream, a file another program appends to
+LIVE_SOURCES = ['Replay a recording', 'TCP stream (host:port)', 'Follow a growing file']
+
+# Recordings above this size are streamed in chunks instead of loaded and cached whole
+LARGE_SESSION_BYTES = 512*1024**2
+
+# Resample loaded sessions onto a uniform grid at this rate (Hz), 0 for the median spacing, None to keep the sensor's timestamps
+RESAMPLE_HZ = None
 
 class MainWindow(QMainWindow):
 
@@ -92,6 +47,14 @@ class MainWindow(QMainWindow):
         self.buttonLayout.addWidget(self.displayButton)
         self.displayButton.clicked.connect(self.diplayPlots)
 
+        self.liveButton = QPushButton('Live')
+        self.buttonLayout.addWidget(self.liveButton)
+        self.liveButton.clicked.connect(self.toggleLive)
+
+        self.compareButton = QPushButton('Compare')
+        self.buttonLayout.addWidget(self.compareButton)
+        self.compareButton.clicked.connect(self.showCompare)
+
         self.prevSwingButton.clicked.connect(self.prevSwing)
         self.nextSwingButton.clicked.connect(self.nextSwing)
 
@@ -110,13 +73,16 @@ class MainWindow(QMainWindow):
         self.moveHitRightButton.clicked.connect(self.hitRight)
         self.moveHitLeftButton.clicked.connect(self.hitLeft)
 
+        for button in (self.moveHitRightButton, self.moveHitLeftButton):
+            button.setAutoRepeat(True)
+            button.setAutoRepeatDelay(300)
+            button.setAutoRepeatInterval(30)
+
         #############################################
         ##                 Yaw Plot                ##
         #############################################
-        self.yawSpeeds = []
-
         layout = QVBoxLayout()
-        self.yawChartView = QChartView()
+        self.yawChartView = SinglePlot('Yaw', 'Time(s)', 'Speed(m/s)')
         layout.addWidget(self.yawChartView)
         self.tbYaw.setLayout(layout)
 
@@ -125,10 +91,8 @@ class MainWindow(QMainWindow):
         #############################################
         ##             Swing Angle Plot            ##
         #############################################
-        self.swingAngles = []
-
         layout = QVBoxLayout()
-        self.swingAngleChartView = QChartView()
+        self.swingAngleChartView = SinglePlot('Swing Angle', 'Time(s)', 'Angle(degrees)')
         layout.addWidget(self.swingAngleChartView)
         self.tbSwingAngle.setLayout(layout)
 
@@ -141,6 +105,11 @@ class MainWindow(QMainWindow):
         self.pbPrevFrame.clicked.connect(self.displayPrevFrame)
         self.pbLastFrame.clicked.connect(self.displayLastFrame)
 
+        self.pbSaveGif = QPushButton('Save GIF')
+        self.pbSaveGif.setEnabled(False)
+        self.pbSaveGif.clicked.connect(self.saveSwingGif)
+        self.horizontalLayout_4.addWidget(self.pbSaveGif)
+
         self.rendered = False
 
         self.directory = os.path.expanduser('~\Documents\\CreoXGolf')
@@ -152,40 +121,181 @@ class MainWindow(QMainWindow):
         #############################################
         self.swingRotations = []
         self.aniObjects = []
+        self.swingResults = None
+        self.sampleDt = None
+        self.sessionPath = None
+        self.frameCache = FrameCache(FRAME_CACHE_BYTES)
+
+        # Analysed sessions are summarized into the library for the compare window. That needs every
+        # swing's yaw and angle series, so it only happens while the compare window is open.
+        self.library = SessionLibrary(os.path.join(self.directory, 'library'))
+        self.compareWindow = None
+        # Set when the loaded session changed since its library entry was written
+        self.indexStale = False
+        # Latest index request per session, a summary overtaken by a newer one is not written
+        self.indexGenerations = {}
+        self.indexLock = threading.Lock()
+
+        # Hit moves repeat quickly, the library entry is rewritten once they stop
+        self.indexTimer = QTimer(self)
+        self.indexTimer.setSingleShot(True)
+        self.indexTimer.setInterval(1000)
+        self.indexTimer.timeout.connect(self.indexSession)
+
+        self.liveSession = None
+        self.liveStop = None
+        self.liveRenderer = None
+        # Enabled state of the loaded session's controls, put back when live mode ends
+        self.liveRestore = {}
+        self.liveTimer = QTimer(self)
+        self.liveTimer.setInterval(int(1000/LIVE_FPS))
+        self.liveTimer.timeout.connect(self.updateLive)
 
         gyroNoise = [[0.0000308652], [0.0000096461], [0.0000239652]]
         accelNoise = [[0.0000165938], [0.0000139291], [0.0000190058]]
-        aRefrence = [[0], [0], [-1]]
-        self.filterObject = QCompFilter(aRefrence, 0.8, 0.1, False)
+        self.filterObject = QCompFilter(A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO, False)
 
-        self.renderObject = Obj_Renderer("axis.obj")
+        # Built on first Render, the pytorch3d backend pulls in torch and starts a worker pool
+        self.renderObject = None
         self.threadpool = QThreadPool()
+        self.threadpool.start(Worker(warmImports))
 
-    def diplayPlots(self):
-        self.nextSwingButton.setEnabled(False)
-        self.prevSwingButton.setEnabled(False)
+        #############################################
+        ##           Job progress / cancel         ##
+        #############################################
+        self.jobs = []
+        self.rotationWorker = None
+        self.loadWorker = None
 
-        self.moveHitRightButton.setEnabled(False)
-        self.moveHitLeftButton.setEnabled(False)
+        self.jobProgressBar = QProgressBar()
+        self.jobProgressBar.setRange(0, 1000)
+        self.jobProgressBar.setMaximumWidth(200)
+        self.jobProgressBar.hide()
+        self.statusBar().addPermanentWidget(self.jobProgressBar)
 
-        nameFilters = {"comma seperated file (*.csv)"}
+        self.cancelJobButton = QPushButton('Cancel')
+        self.cancelJobButton.clicked.connect(self.cancelJobs)
+        self.cancelJobButton.hide()
+        self.statusBar().addPermanentWidget(self.cancelJobButton)
 
-        fileSelector = QFileDialog()
-        fileSelector.setNameFilters(nameFilters)
+        #############################################
+        ##               Debug panel               ##
+        #############################################
+        # Only built with GOLFAPP_PROFILE set, F12 shows / hides it
+        self.debugDock = None
+        if (instrumentation.ENABLED):
+            self.createDebugPanel()
 
-        if (fileSelector.exec()):
-            print(fileSelector.selectedFiles())
+    def createDebugPanel(self):
+        self.debugText = QPlainTextEdit()
+        self.debugText.setReadOnly(True)
+        self.debugText.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+
+        exportButton = QPushButton('Export')
+        exportButton.clicked.connect(self.exportStats)
+        resetButton = QPushButton('Reset')
+        resetButton.clicked.connect(lambda: (instrumentation.reset(), self.updateDebugPanel()))
+
+        buttonLayout = QHBoxLayout()
+        buttonLayout.addWidget(exportButton)
+        buttonLayout.addWidget(resetButton)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.debugText)
+        layout.addLayout(buttonLayout)
+
+        panel = QWidget()
+        panel.setLayout(layout)
+
+        self.debugDock = QDockWidget('Stats', self)
+        self.debugDock.setWidget(panel)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.debugDock)
 
-            df = pd.read_csv(fileSelector.selectedFiles()[0], on_bad_lines='warn', skip_blank_lines=True, encoding='utf-8', encoding_errors='ignore', names=["timestamp", "accelX", "accelY", "accelZ", "baselineX", "baselineY", "baselineZ", "gyroX", "gyroY", "gyroZ", "impactLevel"])
-            df = df.dropna()
+        QShortcut(QKeySequence('F12'), self, lambda: self.debugDock.setVisible(not self.debugDock.isVisible()))
 
-            timestamps = [(i-df.timestamp[0]) * 0.122*10**-3 for i in df.timestamp]
+        self.debugTimer = QTimer(self)
+        self.debugTimer.setInterval(1000)
+        self.debugTimer.timeout.connect(self.updateDebugPanel)
+        self.debugTimer.start()
 
-            self.accelList, self.gyroList, self.timeList, self.peakList = swingDetection([df.accelX.values.tolist(), df.accelY.values.tolist(), df.accelZ.values.tolist()],
-                                                                                         [df.gyroX.values.tolist(), df.gyroY.values.tolist(), df.gyroZ.values.tolist()],
-                                                                                         timestamps)
+    def updateDebugPanel(self):
+        if (self.debugDock.isVisible()):
+            self.debugText.setPlainText(instrumentation.formatStats())
 
-            ############################################################################################################################################################
+    def exportStats(self):
+        filepath, _ = QFileDialog.getSaveFileName(self, 'Export stats', os.path.join(self.directory, 'stats.json'), 'JSON (*.json)')
+        if (filepath):
+            instrumentation.exportStats(filepath)
+            self.statusBar().showMessage(f'Stats written to {filepath}', 3000)
+
+    def swingControls(self):
+        # Controls that act on the loaded session's swings and charts
+        return [self.nextSwingButton, self.prevSwingButton, self.moveHitRightButton, self.moveHitLeftButton, self.tbAnimation]
+
+    def setSwingControlsEnabled(self, enabled, controls=None):
+        # Live mode owns the charts and the image, a change made meanwhile applies when it ends
+        for control in (controls or self.swingControls()):
+            if (self.liveSession is not None):
+                self.liveRestore[control] = enabled
+            else:
+                control.setEnabled(enabled)
+
+    def diplayPlots(self):
+        self.setSwingControlsEnabled(False, self.swingControls()[:4])
+
+        nameFilters = {"comma seperated file (*.csv)"}
+
+        fileSelector = QFileDialog()
+        fileSelector.setNameFilters(nameFilters)
+
+        if (fileSelector.exec()):
+            # Results for the previous file are no longer wanted
+            self.cancelJobs()
+
+            filepath = fileSelector.selectedFiles()[0]
+            self.sampleDt = None
+            self.sessionPath = filepath
+            self.indexTimer.stop()
+            self.indexStale = False
+
+            if (os.path.getsize(filepath) > LARGE_SESSION_BYTES):
+                # Parsed on the thread pool, the load carries on in swingsDetected
+                worker = Worker(self.streamSession, filepath)
+                worker.signals.result.connect(lambda swings, worker=worker: self.swingsDetected(*swings) if worker is self.loadWorker else None)
+                self.loadWorker = worker
+                self.startJob(worker)
+                return
+
+            self.loadWorker = None
+            with instrumentation.span('main.loadSession'):
+                session = loadSession(filepath)
+            instrumentation.count('session.samples', len(session['timestamp']))
+
+            session, timeInfo = timeBase(session, RESAMPLE_HZ is not None, RESAMPLE_HZ)
+            self.sampleDt = timeInfo['dt']
+            self.showTimeInfo(timeInfo)
+
+            with instrumentation.span('main.swingDetection'):
+                swings = swingDetection([session['accelX'], session['accelY'], session['accelZ']],
+                                        [session['gyroX'], session['gyroY'], session['gyroZ']],
+                                        session['time'], self.sampleDt)
+            self.swingsDetected(*swings)
+
+    def streamSession(self, filepath, progress_callback=None, cancel_token=None):
+        with instrumentation.span('main.streamSwingDetection'):
+            return streamSwingDetection(iterCsvChunks(filepath, progress_callback=progress_callback, cancel_token=cancel_token))
+
+    def swingsDetected(self, accelList, gyroList, timeList, peakList):
+        if (len(timeList) == 0):
+            # Nothing to plot or filter, the previous session stays on screen but is no longer indexed
+            self.sessionPath = None
+            self.statusBar().showMessage('No swings found in this recording', 10000)
+            return
+
+        self.accelList, self.gyroList, self.timeList, self.peakList = accelList, gyroList, timeList, peakList
+        instrumentation.count('session.swings', len(self.timeList))
+
+        ############################################################################################################################################################
 #            self.accelList = [df.accelX.values.tolist(),
 #                              df.accelY.values.tolist(),
 #                              df.accelZ.values.tolist()]
@@ -208,207 +318,237 @@ class MainWindow(QMainWindow):
 #                              gyroMagList]]
 
 #            self.timeList = [timestamps]
-            ############################################################################################################################################################
+        ############################################################################################################################################################
+
+        self.swingIndex = 0
+        self.maxIndex = len(self.timeList)
+        # A live view started while the file was streaming keeps the charts until it ends
+        if (self.liveSession is None):
+            self.plotSwing()
+
+        worker = Worker(self.filterObject.batchApply, self.timeList, self.accelList, self.gyroList, dt=self.sampleDt)
+        worker.signals.result.connect(lambda rotations, worker=worker: self.rotationCalculated(rotations) if worker is self.rotationWorker else None)
+        self.rotationWorker = worker
+        self.startJob(worker)
+
+        for animation in self.aniObjects:
+            animation.clear()
+        self.aniObjects = [Animation(self.image, self.lblFrameNum, self.pbPlayFrames, self.frameCache) for _ in range(self.maxIndex)]
+        self.displayAnimation()
 
-            self.swingIndex = 0
-            self.maxIndex = len(self.timeList)
-            self.swingIndicatorLabel.setText(f'{self.swingIndex+1}/{self.maxIndex}')
+    def startJob(self, worker):
+        worker.signals.progress.connect(self.jobProgress)
+        worker.signals.error.connect(self.jobFailed)
+        worker.signals.cancelled.connect(lambda: self.statusBar().showMessage('Cancelled', 3000))
+        worker.signals.finished.connect(lambda worker=worker: self.jobFinished(worker))
 
-            self.accelView.plot(self.timeList[self.swingIndex], self.accelList[self.swingIndex], self.peakList[self.swingIndex])
-            self.gyroView.plot(self.timeList[self.swingIndex], self.gyroList[self.swingIndex], self.peakList[self.swingIndex])
+        self.jobs.append(worker)
+        self.jobProgressBar.setValue(0)
+        self.jobProgressBar.show()
+        self.cancelJobButton.show()
+
+        self.threadpool.start(worker)
 
-            print('Rotation Calculations Start')
+    def cancelJobs(self):
+        for worker in self.jobs:
+            worker.cancel()
 
-            worker = Worker(self.filterObject.batchApply, self.timeList, self.accelList, self.gyroList)
-            worker.signals.result.connect(self.rotationCalculated)
-            self.threadpool.start(worker)
+    def jobProgress(self, fraction, message, done):
+        if (not done):
+            self.jobProgressBar.setValue(int(fraction*1000))
+            self.statusBar().showMessage(message)
 
-            self.aniObjects = [Animation(self.image, self.lblFrameNum, self.pbPlayFrames) for _ in range(self.maxIndex)]
-            self.displayAnimation()
+    def jobFailed(self, error):
+        exctype, value, _ = error
+        self.statusBar().showMessage(f'{exctype.__name__}: {value}')
+
+    def jobFinished(self, worker):
+        if (worker in self.jobs):
+            self.jobs.remove(worker)
+
+        if (not self.jobs):
+            self.jobProgressBar.hide()
+            self.cancelJobButton.hide()
 
     def renderSwing(self):
-        print('Render Start')
         self.pbPlayFrames.setEnabled(False)
 
         with Image.open("loading.png") as im:
             self.image.setPixmap(QPixmap.fromImage(ImageQt(im)))
 
-        worker = Worker(self.renderObject.render_image, self.rotations[self.swingIndex][:self.peakList[self.swingIndex]])
-        worker.signals.result.connect(self.renderCalculated)
+        if (self.renderObject is None):
+            self.renderObject = Obj_Renderer("axis.obj")
 
-        self.threadpool.start(worker)
+        # Frames are shown as they arrive and kept in the frame cache, not round-tripped through a GIF
+        animation = self.aniObjects[self.swingIndex]
+        animation.clear()
+
+        worker = Worker(self.renderFrames, animation, self.rotations[self.swingIndex][:self.peakList[self.swingIndex]])
+        worker.signals.partial.connect(lambda image: self.frameRendered(image, animation))
+        worker.signals.result.connect(lambda frameCount: self.renderCalculated(animation))
+        worker.signals.cancelled.connect(lambda: self.renderStopped(animation))
+        worker.signals.error.connect(lambda error: self.renderStopped(animation))
+        self.startJob(worker)
+
+    def plotSwing(self):
+        self.swingIndicatorLabel.setText(f'{self.swingIndex+1}/{self.maxIndex}')
+        with instrumentation.span('main.plotSwing'):
+            self.accelView.plot(self.timeList[self.swingIndex], self.accelList[self.swingIndex], self.peakList[self.swingIndex])
+            self.gyroView.plot(self.timeList[self.swingIndex], self.gyroList[self.swingIndex], self.peakList[self.swingIndex])
 
     def prevSwing(self):
         if (self.swingIndex > 0):
             self.swingIndex -= 1
-            self.swingIndicatorLabel.setText(f'{self.swingIndex+1}/{self.maxIndex}')
-            self.accelView.plot(self.timeList[self.swingIndex], self.accelList[self.swingIndex], self.peakList[self.swingIndex])
-            self.gyroView.plot(self.timeList[self.swingIndex], self.gyroList[self.swingIndex], self.peakList[self.swingIndex])
+            self.plotSwing()
 
-            self.displayYawData(self.timeList[self.swingIndex][1:], self.yawSpeeds[self.swingIndex])
-            self.displaySwingAnlgeData(self.timeList[self.swingIndex], self.swingAngles[self.swingIndex])
+            self.displaySwingResults()
             self.displayAnimation()
 
     def nextSwing(self):
         if (self.swingIndex < self.maxIndex-1):
             self.swingIndex += 1
-            self.swingIndicatorLabel.setText(f'{self.swingIndex+1}/{self.maxIndex}')
-            self.accelView.plot(self.timeList[self.swingIndex], self.accelList[self.swingIndex], self.peakList[self.swingIndex])
-            self.gyroView.plot(self.timeList[self.swingIndex], self.gyroList[self.swingIndex], self.peakList[self.swingIndex])
+            self.plotSwing()
 
-            self.displayYawData(self.timeList[self.swingIndex][1:], self.yawSpeeds[self.swingIndex])
-            self.displaySwingAnlgeData(self.timeList[self.swingIndex], self.swingAngles[self.swingIndex])
+            self.displaySwingResults()
             self.displayAnimation()
 
     def updatedShoulderWidth(self):
-        self.yawSpeeds = [yawSpeedFromMatrix(self.rotations[i], self.timeList[i], float(self.leShoulderWidth.text())) for i in range(self.maxIndex)]
-        self.displayYawData(self.timeList[self.swingIndex][1:], self.yawSpeeds[self.swingIndex])
-
-    def displayYawData(self, timeList, yawSpeed):
-        self.yawPlotChart = QChart()
-        self.yawPlotChart.setTitle('Yaw')
-        self.yawPlotChart.setTitleBrush(whiteBrush)
-        self.yawPlotChart.setBackgroundBrush(blackBrush)
-        self.yawChartView.setChart(self.yawPlotChart)
-
-        self.yawPlotChart.legend().hide()
-
-        axisX = QValueAxis()
-        axisX.setTitleText('Time(s)')
-        axisX.setTitleBrush(whiteBrush)
-        axisX.setLabelsBrush(whiteBrush)
-        axisX.setGridLineVisible(False)
-        axisX.setTickCount(11)
-        self.yawPlotChart.addAxis(axisX, Qt.AlignBottom)
-
-        axisY = QValueAxis()
-        axisY.setTitleText('Speed(m/s)')
-        axisY.setTitleBrush(whiteBrush)
-        axisY.setLabelsBrush(whiteBrush)
-        axisY.setGridLineVisible(False)
-        axisY.setTickCount(9)
-        self.yawPlotChart.addAxis(axisY, Qt.AlignLeft)
-
-        yawSeries = QSplineSeries()
-        yawSeries.setPen(QPen(QColor("Red"), 1))
-
-        hitSeries = QLineSeries()
-        hitSeries.setPen(QPen(QColor("White"), 1))
-
-        hitSeries.append(timeList[self.peakList[self.swingIndex]], max(yawSpeed) + 0.1*(max(yawSpeed)-min(yawSpeed)))
-        hitSeries.append(timeList[self.peakList[self.swingIndex]], 0)
-
-        length = min(len(timeList), len(yawSpeed))
-
-        for index in range(length):
-            yawSeries.append(timeList[index], yawSpeed[index])
-
-        self.yawPlotChart.addSeries(yawSeries)
-        self.yawPlotChart.addSeries(hitSeries)
+        if (self.swingResults is None):
+            return
 
-        yawSeries.attachAxis(axisX)
-        yawSeries.attachAxis(axisY)
+        self.swingResults.setShoulderWidth(float(self.leShoulderWidth.text()))
+        self.displayYawData(self.timeList[self.swingIndex][1:], self.swingResults.yawSpeeds(self.swingIndex))
+        self.swingResults.prefetch(self.swingIndex)
+        self.markIndexStale()
 
-        hitSeries.attachAxis(axisX)
-        hitSeries.attachAxis(axisY)
+    def displaySwingResults(self):
+        with instrumentation.span('main.displaySwingResults'):
+            self.displayYawData(self.timeList[self.swingIndex][1:], self.swingResults.yawSpeeds(self.swingIndex))
+            self.displaySwingAnlgeData(self.timeList[self.swingIndex], self.swingResults.swingAngles(self.swingIndex))
+            self.swingResults.prefetch(self.swingIndex)
 
-        axisY.setMax(max(yawSpeed) + 0.1*(max(yawSpeed)-min(yawSpeed)))
-        axisY.setMin(0)
+    def displayYawData(self, timeList, yawSpeed):
+        self.yawChartView.plot(timeList, yawSpeed, self.peakList[self.swingIndex])
 
-        self.yawChartView.setChart(self.yawPlotChart)
         self.leMaxSpeed.setText(str(max(yawSpeed)))
         self.leSpeedAtHit.setText(str(yawSpeed[self.peakList[self.swingIndex]]))
 
     def displaySwingAnlgeData(self, timeList, swingAngle):
-        self.swingAngleChart = QChart()
-        self.swingAngleChart.setTitle('Swing Angle')
-        self.swingAngleChart.setTitleBrush(whiteBrush)
-        self.swingAngleChart.setBackgroundBrush(blackBrush)
-        self.swingAngleChartView.setChart(self.swingAngleChart)
-
-        self.swingAngleChart.legend().hide()
-
-        axisX = QValueAxis()
-        axisX.setTitleText('Time(s)')
-        axisX.setTitleBrush(whiteBrush)
-        axisX.setLabelsBrush(whiteBrush)
-        axisX.setGridLineVisible(False)
-        axisX.setTickCount(11)
-        self.swingAngleChart.addAxis(axisX, Qt.AlignBottom)
-
-        axisY = QValueAxis()
-        axisY.setTitleText('Angle(degrees)')
-        axisY.setTitleBrush(whiteBrush)
-        axisY.setLabelsBrush(whiteBrush)
-        axisY.setGridLineVisible(False)
-        axisY.setTickCount(9)
-        self.swingAngleChart.addAxis(axisY, Qt.AlignLeft)
-
-        swingAngleSeries = QSplineSeries()
-        swingAngleSeries.setPen(QPen(QColor("Red"), 1))
-
-        hitSeries = QLineSeries()
-        hitSeries.setPen(QPen(QColor("White"), 1))
-
-        hitSeries.append(timeList[self.peakList[self.swingIndex]], max(swingAngle) + 0.1*(max(swingAngle)-min(swingAngle)))
-        hitSeries.append(timeList[self.peakList[self.swingIndex]], 0)
-
-        length = min(len(timeList), len(swingAngle))
-
-        for index in range(length):
-            swingAngleSeries.append(timeList[index], swingAngle[index])
-
-        self.swingAngleChart.addSeries(swingAngleSeries)
-        self.swingAngleChart.addSeries(hitSeries)
-
-        swingAngleSeries.attachAxis(axisX)
-        swingAngleSeries.attachAxis(axisY)
-
-        hitSeries.attachAxis(axisX)
-        hitSeries.attachAxis(axisY)
-
-        axisY.setMax(max(swingAngle) + 0.1*(max(swingAngle)-min(swingAngle)))
-        axisY.setMin(0)
+        self.swingAngleChartView.plot(timeList, swingAngle, self.peakList[self.swingIndex])
 
-        self.swingAngleChartView.setChart(self.swingAngleChart)
         self.leAngleAtHit.setText(str(swingAngle[self.peakList[self.swingIndex]]))
 
+    def showTimeInfo(self, timeInfo):
+        messages = []
+        if (timeInfo['wraps']):
+            messages.append(f'{timeInfo["wraps"]} timestamp wraparounds')
+        if (timeInfo['dropouts']):
+            longest = max(gap for _, gap in timeInfo['dropouts'])
+            messages.append(f'{len(timeInfo["dropouts"])} dropouts (longest {1000*longest:.0f} ms)')
+        if (timeInfo['dt'] is not None):
+            messages.append(f'resampled at {1/timeInfo["dt"]:.0f} Hz')
+
+        instrumentation.count('session.timestampWraps', timeInfo['wraps'])
+        instrumentation.count('session.dropouts', len(timeInfo['dropouts']))
+        if (messages):
+            self.statusBar().showMessage(', '.join(messages), 10000)
+
     def rotationCalculated(self, rotations):
-        print('Finished Rotation Calculations')
         self.rotations = rotations
 
-        self.nextSwingButton.setEnabled(True)
-        self.prevSwingButton.setEnabled(True)
-
-        self.moveHitRightButton.setEnabled(True)
-        self.moveHitLeftButton.setEnabled(True)
-
+        self.setSwingControlsEnabled(True)
         self.tbSwingStats.setEnabled(True)
-        self.tbAnimation.setEnabled(True)
-
-        self.yawSpeeds = [yawSpeedFromMatrix(self.rotations[i], self.timeList[i], float(self.leShoulderWidth.text())) for i in range(self.maxIndex)]
-        self.displayYawData(self.timeList[self.swingIndex][1:], self.yawSpeeds[self.swingIndex])
 
-        self.swingAngles = [swingAngleFromMatrix(self.rotations[i], np.array([[1],[0],[0]])) for i in range(self.maxIndex)]
-        self.displaySwingAnlgeData(self.timeList[self.swingIndex], self.swingAngles[self.swingIndex])
-
-    def renderCalculated(self, images):
-        images = [Image.fromarray((image.numpy() * 255).astype(np.uint8)) for image in images]
+        if (self.swingResults is not None):
+            self.swingResults.close()
+        self.swingResults = SwingResults(self.rotations, self.timeList, float(self.leShoulderWidth.text()), dt=self.sampleDt)
+        self.displaySwingResults()
+        self.markIndexStale()
+
+    def markIndexStale(self):
+        self.indexStale = True
+        if (self.compareWindow is not None and self.compareWindow.isVisible()):
+            self.indexTimer.start()
+
+    def indexSession(self):
+        # Summaries come from the rotations already calculated, nothing is filtered again
+        if (not self.indexStale or self.sessionPath is None or self.swingResults is None):
+            return
+        self.indexStale = False
+
+        worker = Worker(self.summarizeSession, self.nextIndexGeneration(), self.sessionPath, self.timeList, self.accelList, self.gyroList, list(self.peakList), self.swingResults)
+        worker.signals.result.connect(lambda _: self.compareWindow.refreshSessions() if self.compareWindow is not None else None)
+        worker.signals.error.connect(self.jobFailed)
+        self.threadpool.start(worker)
 
-        gifFilename = f'{self.directory}\\swing{self.swingIndex+1}.gif'
+    def nextIndexGeneration(self):
+        with self.indexLock:
+            generation = self.indexGenerations.get(self.sessionPath, 0) + 1
+            self.indexGenerations[self.sessionPath] = generation
+        return generation
+
+    def summarizeSession(self, generation, filepath, timeList, accelList, gyroList, peakList, swingResults):
+        shoulderWidth = swingResults.shoulderWidth
+        summary = summarizeSwings(timeList, accelList, gyroList, peakList,
+                                  [swingResults.yawSpeeds(i, shoulderWidth) for i in range(len(timeList))],
+                                  [swingResults.swingAngles(i) for i in range(len(timeList))])
+
+        with self.indexLock:
+            if (generation != self.indexGenerations.get(filepath)):
+                return None
+            return self.library.add(filepath, summary, shoulderWidth)
+
+    def showCompare(self):
+        if (self.compareWindow is None):
+            self.compareWindow = CompareWindow(self.library, self.startJob, self.directory, lambda: float(self.leShoulderWidth.text()), self)
+        self.compareWindow.show()
+        self.compareWindow.raise_()
+        self.indexSession()
+
+    def currentAnimation(self, animation):
+        # Frames of a render still running when live mode starts are stored but not shown
+        return self.liveSession is None and self.swingIndex < len(self.aniObjects) and self.aniObjects[self.swingIndex] is animation
+
+    def renderFrames(self, animation, rotations, progress_callback=None, cancel_token=None):
+        # Runs on the worker thread, each frame is compressed to the cache's spill file before it is passed on
+        return animation.storeFrames(self.renderObject.render_frames(rotations, uint8=True, progress_callback=progress_callback, cancel_token=cancel_token))
+
+    def frameRendered(self, image, animation):
+        instrumentation.count('render.framesShown')
+        if (self.currentAnimation(animation)):
+            image, frame = frameToQImage(image)
+            self.image.setPixmap(QPixmap.fromImage(image))
+
+    def renderStopped(self, animation):
+        animation.clear()
+        self.pbPlayFrames.setEnabled(True)
+        if (self.currentAnimation(animation)):
+            self.displayAnimation()
 
-        images[0].save(gifFilename, save_all=True, append_images=images[1:], duration=100)
+    def renderCalculated(self, animation):
+        animation.complete = animation.frameCount() != 0
 
-        self.aniObjects[self.swingIndex].openGif(gifFilename)
+        if (self.currentAnimation(animation)):
+            self.displayAnimation()
 
-        print('done')
+    def saveSwingGif(self):
+        # Optional export, palettizing and encoding run on the thread pool
+        animation = self.aniObjects[self.swingIndex]
+        gifFilename = os.path.join(self.directory, f'swing{self.swingIndex+1}.gif')
 
-        self.displayAnimation()
+        worker = Worker(saveGif, animation.iterFrames(), gifFilename)
+        worker.signals.result.connect(lambda _: self.statusBar().showMessage(f'Saved {gifFilename}', 3000))
+        self.startJob(worker)
 
     def displayAnimation(self):
-        self.rendered = len(self.aniObjects[self.swingIndex].pixmaps) != 0
+        # Playback of the previously shown swing must not keep drawing into the shared label
+        sharedScheduler().stop()
+
+        self.rendered = self.aniObjects[self.swingIndex].complete
+        self.pbSaveGif.setEnabled(self.rendered)
         if (self.rendered):
             self.aniObjects[self.swingIndex].displayFirstFrame()
+            self.pbPlayFrames.setText('Play')
 
             self.pbFirstFrame.setEnabled(True)
             self.pbNextFrame.setEnabled(True)
@@ -441,28 +581,164 @@ class MainWindow(QMainWindow):
         else:
             self.renderSwing()
 
-    def hitRight(self):
-        self.peakList[self.swingIndex] += 1
+    #############################################
+    ##                Live stream              ##
+    #############################################
+    def toggleLive(self):
+        if (self.liveSession is not None):
+            self.stopLive()
+            return
+
+        # Standard input is only offered by the command line (python liveStream.py -)
+        source, ok = QInputDialog.getItem(self, 'Live', 'Source', LIVE_SOURCES, 0, False)
+        if (not ok):
+            return
+
+        if (source == LIVE_SOURCES[1]):
+            address, ok = QInputDialog.getText(self, 'Live', 'host:port', text='localhost:5000')
+            if (not ok):
+                return
+            if (not address.rpartition(':')[2].isdigit()):
+                self.statusBar().showMessage(f'Expected host:port, got "{address}"')
+                return
+            self.startLive(f'tcp://{address}')
+            return
+
+        fileSelector = QFileDialog()
+        fileSelector.setNameFilters({"comma seperated file (*.csv)"})
+        if (fileSelector.exec()):
+            filepath = fileSelector.selectedFiles()[0]
+            self.startLive(filepath if source == LIVE_SOURCES[0] else f'tail:{filepath}')
+
+    def startLive(self, sourceSpec):
+        from liveStream import LiveSession, openSource, runLive
 
-        self.accelView.plot(self.timeList[self.swingIndex], self.accelList[self.swingIndex], self.peakList[self.swingIndex])
-        self.gyroView.plot(self.timeList[self.swingIndex], self.gyroList[self.swingIndex], self.peakList[self.swingIndex])
+        self.liveStop = threading.Event()
+        self.liveSession = LiveSession(self.filterObject, shoulderWidth=float(self.leShoulderWidth.text()))
 
-        self.displayYawData(self.timeList[self.swingIndex][1:], self.yawSpeeds[self.swingIndex])
-        self.displaySwingAnlgeData(self.timeList[self.swingIndex], self.swingAngles[self.swingIndex])
+        worker = Worker(runLive, openSource(sourceSpec, self.liveStop), self.liveSession, self.liveStop)
+        # e.g. a refused connection
+        worker.signals.error.connect(self.jobFailed)
+        worker.signals.finished.connect(self.liveFinished)
+        self.threadpool.start(worker)
+
+        self.liveButton.setText('Stop Live')
+        self.displayButton.setEnabled(False)
+
+        sharedScheduler().stop()
+        self.liveRestore = {control: control.isEnabled() for control in self.swingControls()}
+        for control in self.liveRestore:
+            control.setEnabled(False)
+        self.liveTimer.start()
+
+    def stopLive(self):
+        if (self.liveStop is not None):
+            self.liveStop.set()
+
+    def liveFinished(self):
+        self.updateLive()
+        self.liveTimer.stop()
+        self.liveSession = None
+        self.liveButton.setText('Live')
+        self.displayButton.setEnabled(True)
+
+        for control, enabled in self.liveRestore.items():
+            control.setEnabled(enabled)
+        self.liveRestore = {}
+
+        # The live history replaced the loaded swing in the charts and the image
+        if (self.aniObjects):
+            self.plotSwing()
+            if (self.swingResults is not None and self.swingResults.timeList is self.timeList):
+                self.displaySwingResults()
+            self.displayAnimation()
+
+    def updateLive(self):
+        snapshot = self.liveSession.snapshot() if self.liveSession is not None else None
+        if (snapshot is None or len(snapshot['time']) < 2):
+            return
+
+        timeList = snapshot['time']
+        hitIndex = len(timeList)-1
+        if (snapshot['swings']):
+            lastSwing = snapshot['swings'][-1]
+            hitIndex = min(int(np.searchsorted(timeList, lastSwing['peakTime'])), len(timeList)-1)
+
+            self.swingIndicatorLabel.setText(f'{len(snapshot["swings"])}')
+            self.leMaxSpeed.setText(str(lastSwing['maxYawSpeed']))
+            self.leSpeedAtHit.setText(str(lastSwing['speedAtHit']))
+            self.leAngleAtHit.setText(str(lastSwing['angleAtHit']))
+
+        self.accelView.plot(timeList, snapshot['accel'], hitIndex)
+        self.gyroView.plot(timeList, snapshot['gyro'], hitIndex)
+
+        if (self.liveRenderer is None):
+            self.liveRenderer = Obj_Renderer("axis.obj", backend="numpy")
+        image, frame = frameToQImage(self.liveRenderer.scene.render(snapshot['rotation'], uint8=True))
+        self.image.setPixmap(QPixmap.fromImage(image))
+
+        latency = time.perf_counter() - snapshot['latestArrival']
+        self.statusBar().showMessage(f'Live: {snapshot["sampleCount"]} samples, {len(snapshot["swings"])} swings, '
+                                     f'processing {1000*snapshot["processLatency"]:.1f} ms, end-to-end {1000*latency:.1f} ms')
+
+    def closeEvent(self, event):
+        self.stopLive()
+        self.cancelJobs()
+        sharedScheduler().stop()
+        # Changes to a session already in the library (a hit moved in the last second) are written
+        # now, sessions never indexed stay that way. A source moved away since is left alone.
+        self.indexTimer.stop()
+        if (self.indexStale and self.swingResults is not None):
+            try:
+                if (self.library.isCurrent(self.sessionPath)):
+                    self.summarizeSession(self.nextIndexGeneration(), self.sessionPath, self.timeList, self.accelList, self.gyroList, list(self.peakList), self.swingResults)
+            except Exception as e:
+                print(f'Could not index {self.sessionPath}: {e}')
+        if (self.compareWindow is not None):
+            self.compareWindow.close()
+        self.frameCache.close()
+        if (self.swingResults is not None):
+            self.swingResults.close()
+        if (self.renderObject is not None):
+            self.renderObject.close()
+        super().closeEvent(event)
+
+    def hitRight(self):
+        self.moveHit(1)
 
     def hitLeft(self):
-        self.peakList[self.swingIndex] -= 1
+        self.moveHit(-1)
+
+    def moveHit(self, step):
+        peakIndex = self.peakList[self.swingIndex] + step
+        if (not 0 <= peakIndex < len(self.timeList[self.swingIndex])-1):
+            return
+
+        self.peakList[self.swingIndex] = peakIndex
 
-        self.accelView.plot(self.timeList[self.swingIndex], self.accelList[self.swingIndex], self.peakList[self.swingIndex])
-        self.gyroView.plot(self.timeList[self.swingIndex], self.gyroList[self.swingIndex], self.peakList[self.swingIndex])
+        self.accelView.moveHit(peakIndex)
+        self.gyroView.moveHit(peakIndex)
+        self.yawChartView.moveHit(peakIndex)
+        self.swingAngleChartView.moveHit(peakIndex)
 
-        self.displayYawData(self.timeList[self.swingIndex][1:], self.yawSpeeds[self.swingIndex])
-        self.displaySwingAnlgeData(self.timeList[self.swingIndex], self.swingAngles[self.swingIndex])
+        self.leSpeedAtHit.setText(str(self.swingResults.yawSpeeds(self.swingIndex)[peakIndex]))
+        self.leAngleAtHit.setText(str(self.swingResults.swingAngles(self.swingIndex)[peakIndex]))
+
+        self.markIndexStale()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+
     app = QApplication(sys.argv)
+    instrumentation.startProfiler()
 
     window = MainWindow()
     window.show()
+    # Process start to window shown, recorded once so it shows up in the debug panel and the exported stats
+    instrumentation.addSpan('main.startup', time.perf_counter()-startTime)
+
+    # python main.py --live <tcp://host:port | - | tail:file | recording.csv>
+    if ('--live' in sys.argv[1:-1]):
+        window.startLive(sys.argv[sys.argv.index('--live')+1])
     app.exec_()
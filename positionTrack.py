@@ -1,11 +1,18 @@
+import os
+import math
+import threading
+import importlib.util
 import numpy as np
 from multiprocessing import Pool
-from quart import Quaternion
+from concurrent.futures import ThreadPoolExecutor
+from quart import Quaternion, FastQuaternion, QuaternionArray
+from jobControl import reportProgress
+import instrumentation
 
-def chartEtoQ(e) -> Quaternion:
+def chartEtoQ(e) -> FastQuaternion:
     eT = [i[0] for i in e]
     q = 1 / np.sqrt(4 + sum([i**2 for i in eT]))
-    return Quaternion(2*q, [q*i for i in eT])
+    return FastQuaternion(2*q, [q*i for i in eT])
 
 def chartQtoE(q: Quaternion):
     return [[2*i/q.q0] for i in q.q]
@@ -35,92 +42,358 @@ def EtoR(e):
 
     return np.matmul(np.matmul(yaw, pitch), roll)
 
+#############################################
+##          Batch (N,4) / (N,3) engine      ##
+#############################################
+
+def localToWorld(vectors):
+    vectors = np.asarray(vectors, dtype=float)
+    return np.column_stack((vectors[:, 1], vectors[:, 2], -vectors[:, 0]))
+
+def gyroDeltaQuaternions(dtArray, wk):
+    # dtArray may be a scalar for uniformly sampled data
+    w_mag = np.sqrt(wk[:, 0]**2 + wk[:, 1]**2 + wk[:, 2]**2)
+    w_angle = w_mag*dtArray/2
+
+    w_delta = np.zeros((len(wk), 4))
+    w_delta[:, 0] = np.cos(w_angle)
+
+    # Samples with no rotation keep a zero axis
+    np.divide(wk*np.sin(w_angle)[:, None], w_mag[:, None], out=w_delta[:, 1:], where=(w_mag != 0)[:, None])
+
+    return w_delta
+
+def accelQuaternions(ak, aRef):
+    a_mag = np.sqrt(ak[:, 0]**2 + ak[:, 1]**2 + ak[:, 2]**2)
+    n0, n1, n2 = (ak/a_mag[:, None]).T
+
+    a_angle = np.arccos(aRef[0]*n0 + aRef[1]*n1 + aRef[2]*n2)
+    a_sin = np.sin(a_angle/2)
+
+    # aRef x ak_norm, written out to skip np.cross's axis handling
+    a_q = np.empty((len(ak), 4))
+    a_q[:, 0] = np.cos(a_angle/2)
+    a_q[:, 1] = (aRef[1]*n2 - aRef[2]*n1)*a_sin
+    a_q[:, 2] = (aRef[2]*n0 - aRef[0]*n2)*a_sin
+    a_q[:, 3] = (aRef[0]*n1 - aRef[1]*n0)*a_sin
+
+    return a_q
+
+def accelWeights(accelMag, accelRatio, accelDistro):
+    return accelRatio*np.exp(-0.5*((np.asarray(accelMag, dtype=float)-1)/accelDistro)**2)
+
+def chartNormalize(qArray):
+    e = 2*qArray[:, 1:]/qArray[:, :1]
+    q = 1 / np.sqrt(4 + (e[:, 0]**2 + e[:, 1]**2 + e[:, 2]**2))
+
+    return np.column_stack((2*q, q[:, None]*e))
+
+def quaternionsToR(qArray):
+    return QuaternionArray(qArray).toR()
+
+def filterRecurrence(qInit, w_delta, a_q, accelProportion):
+    # Each step depends on the previous quaternion, so this is the only sequential part.
+    # Plain floats keep the per-sample cost to a handful of multiplies.
+    s0, s1, s2, s3 = (float(i) for i in qInit)
+    qList = [(s0, s1, s2, s3)]
+
+    for (d0, d1, d2, d3), (a0, a1, a2, a3), p in zip(w_delta.tolist(), a_q.tolist(), accelProportion.tolist()):
+        # w_q = q_previous * w_delta
+        w0 = s0*d0 - (s1*d1 + s2*d2 + s3*d3)
+        w1 = s0*d1 + d0*s1 + (s2*d3 - s3*d2)
+        w2 = s0*d2 + d0*s2 + (s3*d1 - s1*d3)
+        w3 = s0*d3 + d0*s3 + (s1*d2 - s2*d1)
+
+        # adjusted_q = (1-p) * w_q + p * a_q
+        r = 1-p
+        j0 = w0*r + a0*p
+        j1 = w1*r + a1*p
+        j2 = w2*r + a2*p
+        j3 = w3*r + a3*p
+
+        # chartEtoQ(chartQtoE(adjusted_q))
+        e1 = 2*j1/j0
+        e2 = 2*j2/j0
+        e3 = 2*j3/j0
+        n = 1 / math.sqrt(4 + (e1*e1 + e2*e2 + e3*e3))
+
+        s0, s1, s2, s3 = 2*n, n*e1, n*e2, n*e3
+        qList.append((s0, s1, s2, s3))
+
+    return np.array(qList)
+
+#############################################
+##        Compiled recurrence kernel       ##
+#############################################
+# filterRecurrence over flat float64 arrays, written so numba can compile it into one native
+# loop. Only +, -, *, / and sqrt happen per step, all correctly rounded, so the compiled loop
+# gives the same bits as filterRecurrence. The transcendental parts (cos, sin, arccos, exp)
+# stay in the vectorized NumPy kernels, whose SIMD routines a JIT's libm calls would not match.
+# Compiled on first use (and cached on disk) so importing this module stays cheap.
+
+def filterRecurrenceLoop(qInit, w_delta, a_q, accelProportion, qArray):
+    s0, s1, s2, s3 = qInit[0], qInit[1], qInit[2], qInit[3]
+    qArray[0, 0] = s0
+    qArray[0, 1] = s1
+    qArray[0, 2] = s2
+    qArray[0, 3] = s3
+
+    for k in range(len(accelProportion)):
+        d0, d1, d2, d3 = w_delta[k, 0], w_delta[k, 1], w_delta[k, 2], w_delta[k, 3]
+        p = accelProportion[k]
+
+        # w_q = q_previous * w_delta
+        w0 = s0*d0 - (s1*d1 + s2*d2 + s3*d3)
+        w1 = s0*d1 + d0*s1 + (s2*d3 - s3*d2)
+        w2 = s0*d2 + d0*s2 + (s3*d1 - s1*d3)
+        w3 = s0*d3 + d0*s3 + (s1*d2 - s2*d1)
+
+        # adjusted_q = (1-p) * w_q + p * a_q
+        r = 1-p
+        j0 = w0*r + a_q[k, 0]*p
+        j1 = w1*r + a_q[k, 1]*p
+        j2 = w2*r + a_q[k, 2]*p
+        j3 = w3*r + a_q[k, 3]*p
+
+        # chartEtoQ(chartQtoE(adjusted_q))
+        e1 = 2*j1/j0
+        e2 = 2*j2/j0
+        e3 = 2*j3/j0
+        n = 1 / math.sqrt(4 + (e1*e1 + e2*e2 + e3*e3))
+
+        s0, s1, s2, s3 = 2*n, n*e1, n*e2, n*e3
+        qArray[k+1, 0] = s0
+        qArray[k+1, 1] = s1
+        qArray[k+1, 2] = s2
+        qArray[k+1, 3] = s3
+
+    return qArray
+
+compiledLoop = None
+compileLock = threading.Lock()
+
+def jitAvailable():
+    return importlib.util.find_spec("numba") is not None
+
+def compiledFilterLoop():
+    global compiledLoop
+
+    with compileLock:
+        if (compiledLoop is None):
+            import numba
+
+            # error_model='numpy' keeps IEEE division (inf/nan, no ZeroDivisionError) like the NumPy path,
+            # nogil lets ThreadExecutor run swings side by side
+            try:
+                compiledLoop = numba.njit(cache=True, nogil=True, error_model='numpy')(filterRecurrenceLoop)
+            except RuntimeError:
+                # No writable cache location, e.g. a frozen build
+                compiledLoop = numba.njit(nogil=True, error_model='numpy')(filterRecurrenceLoop)
+
+    return compiledLoop
+
+def compiledRecurrence(qInit, w_delta, a_q, accelProportion):
+    return compiledFilterLoop()(np.ascontiguousarray(qInit, dtype=float), np.ascontiguousarray(w_delta, dtype=float),
+                                np.ascontiguousarray(a_q, dtype=float), np.ascontiguousarray(accelProportion, dtype=float),
+                                np.empty((len(accelProportion)+1, 4)))
+
+#############################################
+##           batchApply executors          ##
+#############################################
+def starCall(job):
+    fn, args = job
+    return fn(*args)
+
+class SerialExecutor:
+    def imap(self, fn, argsList):
+        return (fn(*args) for args in argsList)
+
+    def map(self, fn, argsList):
+        return list(self.imap(fn, argsList))
+
+class ThreadExecutor:
+    def __init__(self, workers=None) -> None:
+        self.workers = workers
+
+    def imap(self, fn, argsList):
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = [executor.submit(fn, *args) for args in argsList]
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def map(self, fn, argsList):
+        return list(self.imap(fn, argsList))
+
+class ProcessExecutor:
+    def __init__(self, processes=None, chunkSize=None) -> None:
+        self.processes = processes
+        self.chunkSize = chunkSize
+
+    def imap(self, fn, argsList):
+        # Leaving the loop early (cancellation) terminates the pool
+        processes = self.processes or os.cpu_count() or 1
+        chunkSize = self.chunkSize or max(1, math.ceil(len(argsList)/(4*processes)))
+
+        with Pool(processes) as pool:
+            yield from pool.imap(starCall, [(fn, args) for args in argsList], chunksize=chunkSize)
+
+    def map(self, fn, argsList):
+        return list(self.imap(fn, argsList))
+
+def chooseExecutor(swingCount, totalSamples, compiled=False):
+    # Filtering runs at roughly 2us per sample, so process start-up and pickling only pay off
+    # for long sessions. The recurrence holds the GIL, so threads only overlap the NumPy parts
+    # of a handful of long swings.
+    if (swingCount <= 1 or totalSamples < 500000):
+        return SerialExecutor()
+    # The compiled recurrence is ~0.4us per sample and releases the GIL, every new process would
+    # also have to load it again, so threads are always the better fit
+    if (compiled):
+        return ThreadExecutor(min(swingCount, os.cpu_count() or 1))
+    if (swingCount < 4):
+        return ThreadExecutor(swingCount)
+    return ProcessExecutor()
+
 class QCompFilter:
-    def __init__(self, aRef, accelRatio: float, accelDistro: float, debugFlag: bool) -> None:
+    # Immutable settings only, every applyData call keeps its own state so one filter can be
+    # shared between threads, processes and swings
+    # kernel: "numba" runs the recurrence through the compiled filterRecurrenceLoop, "numpy" through
+    # filterRecurrence, "auto" uses numba when it is installed. Both give identical results.
+    def __init__(self, aRef, accelRatio: float, accelDistro: float, debugFlag: bool, kernel="auto") -> None:
+        if (kernel == "auto"):
+            kernel = "numba" if jitAvailable() else "numpy"
+        if (kernel not in ("numba", "numpy")):
+            raise Exception(f"Unknown filter kernel {kernel}")
+
+        self.kernel = kernel
         self.accelRatio = accelRatio
         self.accelDistro = accelDistro
-        
+
 #        self.aRef = np.array(aRef)
-        self.aRef = np.array([aRef[1], aRef[2], [-aRef[0][0]]])
+        aRef = np.array([aRef[1], aRef[2], [-aRef[0][0]]], dtype=float)
+        aRef.setflags(write=False)
+        self.aRef = aRef
 
         self.debugFlag = debugFlag
 
         if (self.debugFlag):
             print(f'aRef:\n{self.aRef}')
 
-    def getQInit(self, firstAccel):
-        a_mag = np.sqrt(sum([i[0]**2 for i in firstAccel]))
-        ak_norm = firstAccel/a_mag
+        self.frozen = True
+
+    def __setattr__(self, name, value):
+        if (getattr(self, 'frozen', False)):
+            raise AttributeError(f"QCompFilter settings are read-only, create a new filter to change {name}")
+        super().__setattr__(name, value)
 
-        a_angle = np.arccos(sum([a*b for a,b in zip(self.aRef, ak_norm)])[0])
-        a_axis = np.cross(self.aRef.T, ak_norm.T)[0]
+    def batchApply(self, timeLists, accelLists, gyroLists, executor=None, dt=None, progress_callback=None, cancel_token=None):
+        poolArgs = [(timeLists[i], accelLists[i], gyroLists[i], dt) for i in range(len(timeLists))]
 
-        qTemp = chartEtoQ(chartQtoE(Quaternion(np.cos(a_angle/2), [i*np.sin(a_angle/2) for i in a_axis])))
-        self.q = [qTemp]
+        if (executor is None):
+            executor = chooseExecutor(len(poolArgs), sum(len(i) for i in timeLists), self.kernel == "numba")
 
-    def batchApply(self, timeLists, accelLists, gyroLists):
-        with Pool() as pool:
-            poolArgs = [(timeLists[i], accelLists[i], gyroLists[i]) for i in range(len(timeLists))]
-            swingRotations = pool.starmap(self.applyData, poolArgs)
+        swingRotations = []
+        with instrumentation.span('positionTrack.batchApply'):
+            for rotations in executor.imap(self.applyData, poolArgs):
+                if (cancel_token is not None):
+                    cancel_token.check()
+
+                swingRotations.append(rotations)
+                instrumentation.count('filter.swings')
+                reportProgress(progress_callback, len(swingRotations), len(poolArgs), f'Swing {len(swingRotations)}/{len(poolArgs)}')
 
         return swingRotations
 
-    def applyData(self, timeList, accelList, gyroList):
-        ak_0 = np.array([[accelList[1][0]],
-                         [accelList[2][0]],
-                         [-accelList[0][0]]])
-        self.getQInit(ak_0)
+    # dt: the fixed sample step of resampled data, skips differencing the time array
+    def applyData(self, timeList, accelList, gyroList, dt=None):
+        accelArray = np.column_stack((accelList[0], accelList[1], accelList[2]))
+        gyroArray = np.column_stack((gyroList[0], gyroList[1], gyroList[2]))
+
+        return self.applyArrays(np.asarray(timeList, dtype=float), accelArray, gyroArray, np.asarray(accelList[3], dtype=float), dt)
+
+    def applyArrays(self, timeArray, accelArray, gyroArray, accelMag, dt=None):
+        with instrumentation.span('positionTrack.applyArrays'):
+            instrumentation.count('filter.samples', len(timeArray))
+            return self.filterArrays(timeArray, accelArray, gyroArray, accelMag, dt)
+
+    def recurrence(self, qInit, w_delta, a_q, accelProportion):
+        if (self.kernel == "numba"):
+            return compiledRecurrence(qInit, w_delta, a_q, accelProportion)
+        return filterRecurrence(qInit, w_delta, a_q, accelProportion)
 
-        for i in range(0, len(timeList)-1):
-            q_previous = self.q[-1]
-            dt = (timeList[i+1] - timeList[i])
+    def filterArrays(self, timeArray, accelArray, gyroArray, accelMag, dt=None):
+        length = len(timeArray)
 
-            #############################################
-            ##             LOCAL -> WORLD              ##
-            ##                 X -> -Z                 ##
-            ##                 Y -> X                  ##
-            ##                 Z -> Y                  ##
-            #############################################
+        #############################################
+        ##             LOCAL -> WORLD              ##
+        ##                 X -> -Z                 ##
+        ##                 Y -> X                  ##
+        ##                 Z -> Y                  ##
+        #############################################
 
-            wk = np.array([[gyroList[1][i+1] * np.pi/180],
-                           [gyroList[2][i+1] * np.pi/180],
-                           [-gyroList[0][i+1] * np.pi/180]])
+        ak = localToWorld(accelArray[:length])
+        wk = localToWorld(gyroArray[1:length]) * np.pi/180
 
-            ak = np.array([[accelList[1][i+1]],
-                           [accelList[2][i+1]],
-                           [-accelList[0][i+1]]])
+        qInit = chartNormalize(accelQuaternions(ak[:1], self.aRef[:, 0]))[0]
 
-            w_mag = np.sqrt(sum([i[0]**2 for i in wk]))
-            w_angle = w_mag*dt/2
+        w_delta = gyroDeltaQuaternions(np.diff(timeArray) if dt is None else dt, wk)
+        a_q = accelQuaternions(ak[1:], self.aRef[:, 0])
+        accelProportion = accelWeights(accelMag[1:length], self.accelRatio, self.accelDistro)
+
+        qArray = self.recurrence(qInit, w_delta, a_q, accelProportion)
+
+        if (self.debugFlag):
+            print(f'wk:\n{wk}')
+            print(f'ak:\n{ak}')
+            print(f'w_delta:\n{w_delta}')
+            print(f'a_q:\n{a_q}')
+            print(f'q:\n{qArray}')
 
-            if w_mag == 0:
-                w_delta = Quaternion(np.cos(w_angle), [0.0 ,0.0 ,0.0])
-            else:
-                w_delta = Quaternion(np.cos(w_angle), [i[0]*np.sin(w_angle)/w_mag for i in wk])
+        return quaternionsToR(qArray)
 
-            w_q = q_previous * w_delta
+class QCompFilterStream:
+    # Incremental QCompFilter for live data: feed samples in arrival order, in chunks of any size,
+    # and get their rotations back. Uses the same kernels as applyArrays so the results match.
+    def __init__(self, filterObject: QCompFilter) -> None:
+        self.filterObject = filterObject
+        self.q = None
+        self.lastTime = None
 
-            a_mag = np.sqrt(sum([i[0]**2 for i in ak]))
-            ak_norm = ak/a_mag
+    def reset(self):
+        self.q = None
+        self.lastTime = None
 
-            a_angle = np.arccos(sum([a*b for a,b in zip(self.aRef, ak_norm)])[0])
-            a_axis = np.cross(self.aRef.T, ak_norm.T)[0]
+    def update(self, timeArray, accelArray, gyroArray, accelMag):
+        timeArray = np.asarray(timeArray, dtype=float)
+        if (len(timeArray) == 0):
+            return np.empty((0, 3, 3))
+        instrumentation.count('filter.liveSamples', len(timeArray))
 
-            a_q = Quaternion(np.cos(a_angle/2), [i*np.sin(a_angle/2) for i in a_axis])
+        aRef = self.filterObject.aRef[:, 0]
+        ak = localToWorld(accelArray)
+        wk = localToWorld(gyroArray) * np.pi/180
+        accelMag = np.asarray(accelMag, dtype=float)
 
-            accelList[3]
+        qList = []
+        if (self.q is None):
+            self.q = chartNormalize(accelQuaternions(ak[:1], aRef))[0]
+            self.lastTime = timeArray[0]
+            qList.append(self.q[None])
 
-            accelProportion = self.accelRatio*np.exp(-0.5*((accelList[3][i+1]-1)/self.accelDistro)**2)
-            adjusted_q = (1-accelProportion) * w_q + accelProportion * a_q
+            timeArray, ak, wk, accelMag = timeArray[1:], ak[1:], wk[1:], accelMag[1:]
 
-            self.q.append(chartEtoQ(chartQtoE(adjusted_q)))
+        if (len(timeArray) > 0):
+            w_delta = gyroDeltaQuaternions(np.diff(timeArray, prepend=self.lastTime), wk)
+            a_q = accelQuaternions(ak, aRef)
+            accelProportion = accelWeights(accelMag, self.filterObject.accelRatio, self.filterObject.accelDistro)
 
-            if (self.debugFlag):
-                print(f'wk:\n{wk}')
-                print(f'ak:\n{ak}')
-                print(f'w_q: {w_q}')
-                print(f'a_q: {a_q}')
-                print(f'adjusted_q: {adjusted_q}')
-                print(f'q: {self.q[-1]}')
+            qArray = self.filterObject.recurrence(self.q, w_delta, a_q, accelProportion)[1:]
+            self.q = qArray[-1]
+            self.lastTime = timeArray[-1]
+            qList.append(qArray)
 
-        return [np.array(i.toR()) for i in self.q]
+        return quaternionsToR(np.concatenate(qList))
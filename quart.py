@@ -1,3 +1,4 @@
+import numbers
 import numpy as np
 
 class Quaternion:
@@ -61,3 +62,158 @@ class Quaternion:
         q = Quaternion(0, vector)
         rq = self * q * self.conj()
         return rq.q
+
+class FastQuaternion:
+    __slots__ = ('q0', 'x', 'y', 'z')
+
+    def __init__(self, q0, q) -> None:
+        self.q0 = float(q0)
+        self.x, self.y, self.z = (float(i) for i in q)
+
+    @property
+    def q(self):
+        return [self.x, self.y, self.z]
+
+    def __rmul__(self, other) -> 'FastQuaternion':
+        if (isinstance(other, numbers.Real)):
+            return FastQuaternion(self.q0*other, (self.x*other, self.y*other, self.z*other))
+        raise Exception(f"Cannot multiply <class 'FastQuaternion'> with {type(other)}")
+
+    def __mul__(self, other) -> 'FastQuaternion':
+        if (isinstance(other, (FastQuaternion, Quaternion))):
+            b0 = other.q0
+            b1, b2, b3 = other.q
+            q0 = self.q0*b0 - (self.x*b1 + self.y*b2 + self.z*b3)
+            return FastQuaternion(q0, (self.q0*b1 + b0*self.x + (self.y*b3 - self.z*b2),
+                                       self.q0*b2 + b0*self.y + (self.z*b1 - self.x*b3),
+                                       self.q0*b3 + b0*self.z + (self.x*b2 - self.y*b1)))
+        if (isinstance(other, numbers.Real)):
+            return other*self
+        raise Exception(f"Cannot multiply <class 'FastQuaternion'> with {type(other)}")
+
+    def __add__(self, other) -> 'FastQuaternion':
+        if (isinstance(other, (FastQuaternion, Quaternion))):
+            b1, b2, b3 = other.q
+            return FastQuaternion(self.q0 + other.q0, (self.x + b1, self.y + b2, self.z + b3))
+        raise Exception(f"Cannot add <class 'FastQuaternion'> with {type(other)}")
+
+    def __str__(self) -> str:
+        return f'[{self.q0}, {self.x}, {self.y}, {self.z}]'
+
+    def conj(self) -> 'FastQuaternion':
+        return FastQuaternion(self.q0, (-self.x, -self.y, -self.z))
+
+    def toArray(self):
+        return np.array([self.q0, self.x, self.y, self.z])
+
+    def toR(self):
+        return QuaternionArray(self.toArray()).toR()[0].tolist()
+
+    def toEular(self):
+        return QuaternionArray(self.toArray()).toEular()[0].tolist()
+
+    def rotateVector(self, vector):
+        rq = self * FastQuaternion(0, vector) * self.conj()
+        return rq.q
+
+
+class QuaternionArray:
+    __slots__ = ('array',)
+    __array_ufunc__ = None
+
+    def __init__(self, array) -> None:
+        self.array = np.asarray(array, dtype=float).reshape(-1, 4)
+
+    @classmethod
+    def fromQuaternions(cls, quaternions) -> 'QuaternionArray':
+        return cls([[q.q0, *q.q] for q in quaternions])
+
+    @property
+    def q0(self):
+        return self.array[:, 0]
+
+    @property
+    def q(self):
+        return self.array[:, 1:]
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __getitem__(self, index):
+        if (isinstance(index, numbers.Integral)):
+            return FastQuaternion(self.array[index, 0], self.array[index, 1:])
+        return QuaternionArray(self.array[index])
+
+    def __iter__(self):
+        return (FastQuaternion(row[0], row[1:]) for row in self.array.tolist())
+
+    def __rmul__(self, other) -> 'QuaternionArray':
+        if (isinstance(other, numbers.Real) or isinstance(other, np.ndarray)):
+            return QuaternionArray(self.array*np.reshape(other, (-1, 1)))
+        raise Exception(f"Cannot multiply <class 'QuaternionArray'> with {type(other)}")
+
+    def __mul__(self, other) -> 'QuaternionArray':
+        if (isinstance(other, (QuaternionArray, FastQuaternion, Quaternion))):
+            b = other.array if isinstance(other, QuaternionArray) else np.array([[other.q0, *other.q]])
+            a0, a1, a2, a3 = self.array.T
+            b0, b1, b2, b3 = b.T
+
+            result = np.empty(np.broadcast(a0, b0).shape + (4,))
+            result[:, 0] = a0*b0 - (a1*b1 + a2*b2 + a3*b3)
+            result[:, 1] = a0*b1 + b0*a1 + (a2*b3 - a3*b2)
+            result[:, 2] = a0*b2 + b0*a2 + (a3*b1 - a1*b3)
+            result[:, 3] = a0*b3 + b0*a3 + (a1*b2 - a2*b1)
+            return QuaternionArray(result)
+        return other*self
+
+    def __add__(self, other) -> 'QuaternionArray':
+        if (isinstance(other, QuaternionArray)):
+            return QuaternionArray(self.array + other.array)
+        raise Exception(f"Cannot add <class 'QuaternionArray'> with {type(other)}")
+
+    def __str__(self) -> str:
+        return str(self.array)
+
+    def conj(self) -> 'QuaternionArray':
+        return QuaternionArray(self.array*[1, -1, -1, -1])
+
+    def norm(self):
+        a = self.array
+        return np.sqrt(a[:, 0]**2 + a[:, 1]**2 + a[:, 2]**2 + a[:, 3]**2)
+
+    def normalize(self) -> 'QuaternionArray':
+        return QuaternionArray(self.array/self.norm()[:, None])
+
+    def toR(self):
+        q0, q1, q2, q3 = self.array.T
+
+        R = np.empty((len(self.array), 3, 3))
+        R[:, 0, 0] = 1-2*q2**2-2*q3**2
+        R[:, 0, 1] = 2*(q1*q2-q3*q0)
+        R[:, 0, 2] = 2*(q1*q3+q2*q0)
+        R[:, 1, 0] = 2*(q1*q2+q3*q0)
+        R[:, 1, 1] = 1-2*q1**2-2*q3**2
+        R[:, 1, 2] = 2*(q2*q3-q1*q0)
+        R[:, 2, 0] = 2*(q1*q3-q2*q0)
+        R[:, 2, 1] = 2*(q2*q3+q1*q0)
+        R[:, 2, 2] = 1-2*q1**2-2*q2**2
+
+        return R
+
+    def toEular(self):
+        q0, q1, q2, q3 = self.array.T
+
+        sinr_cosp = 2 * (q0 * q1 + q2 * q3)
+        cosr_cosp = 1 - 2 * (q1 * q1 + q2 * q2)
+
+        sinp = 2 * (q0 * q2 - q3 * q1)
+        pitch = np.where(np.abs(sinp) >= 1, np.copysign(np.pi / 2, sinp), np.arcsin(np.clip(sinp, -1, 1)))
+
+        siny_cosp = 2 * (q0 * q3 + q1 * q2)
+        cosy_cosp = 1 - 2 * (q2 * q2 + q3 * q3)
+
+        return np.column_stack((np.arctan2(sinr_cosp, cosr_cosp), pitch, np.arctan2(siny_cosp, cosy_cosp)))
+
+    def rotateVector(self, vectors):
+        vectors = np.broadcast_to(np.asarray(vectors, dtype=float).reshape(-1, 3), (len(self.array), 3))
+        return (self * QuaternionArray(np.column_stack((np.zeros(len(vectors)), vectors))) * self.conj()).q
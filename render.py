@@ -1,30 +1,32 @@
-from json import load
-import torch
-
-from pytorch3d.io import load_obj
-from pytorch3d.structures import Meshes, join_meshes_as_batch
-from pytorch3d.transforms import RotateAxisAngle, quaternion_to_matrix, Rotate
-from pytorch3d.renderer import(
-    look_at_view_transform,
-    FoVPerspectiveCameras,
-    Materials,
-    RasterizationSettings,
-    MeshRenderer,
-    MeshRasterizer,
-    SoftPhongShader,
-    HardFlatShader,
-    TexturesVertex,
-    TexturesAtlas,
-    PointsRenderer,
-    PointsRasterizationSettings,
-    PointsRasterizer,
-    PointLights
-)
-
+import os
+import importlib.util
+from functools import partial
+import numpy as np
 from multiprocessing import Pool
+from PIL import Image, ImageDraw
 
-class Obj_Renderer:
+from jobControl import reportProgress
+import instrumentation
+
+IMAGE_SIZE = 512
+CAMERA_DIST = 10
+CAMERA_ELEV = 10
+CAMERA_AZIM = 0
+CAMERA_FOV = 60
+
+class AxisScene:
     def __init__(self, filepath) -> None:
+        import torch
+        from pytorch3d.io import load_obj
+        from pytorch3d.renderer import(
+            look_at_view_transform,
+            FoVPerspectiveCameras,
+            RasterizationSettings,
+            MeshRenderer,
+            MeshRasterizer,
+            HardFlatShader
+        )
+
         self.device = torch.device("cpu")
 
         self.verts, self.faces, aux = load_obj(
@@ -39,16 +41,16 @@ class Obj_Renderer:
         self.atlas = aux.texture_atlas
 
         raster_settings = RasterizationSettings(
-            image_size=512,
+            image_size=IMAGE_SIZE,
             blur_radius=0,
             faces_per_pixel=1,
             bin_size=None
         )
 
         R, T = look_at_view_transform(
-            dist=10,
-            elev=10,
-            azim=0
+            dist=CAMERA_DIST,
+            elev=CAMERA_ELEV,
+            azim=CAMERA_AZIM
         )
 
         cameras = FoVPerspectiveCameras(
@@ -72,23 +74,228 @@ class Obj_Renderer:
             shader=shader
         )
 
-    def render_image(self, rotations):
-        batch_size = len(rotations)
+    def render(self, rotation, uint8=False):
+        return self.renderBatch([rotation], uint8)[0]
 
-        
-        matrixList = [torch.as_tensor(rot) for rot in rotations]
+    def renderBatch(self, rotations, uint8=False):
+        import torch
+        from pytorch3d.structures import Meshes
+        from pytorch3d.renderer import TexturesAtlas
 
-        # matrixlist = [quaternion_to_matrix(quart) for quart in quartRotations]
-        rotlist = [Rotate(matrix, device=self.device) for matrix in matrixList]
-        vertlist = [rot.transform_points(self.verts) for rot in rotlist]
-        meshlist = [Meshes(verts=[verts], faces=[self.faces.verts_idx],textures=TexturesAtlas(atlas=[self.atlas])) for verts in vertlist]
+        # one (B,3,3) bmm over the shared vertices and a single rasterizer pass for the whole batch
+        with instrumentation.span('render.renderBatch'):
+            R = torch.as_tensor(np.asarray(rotations), dtype=self.verts.dtype, device=self.device)
+            batch_size = R.shape[0]
 
-        images = []
-        with Pool() as pool:
-            poolArg = [[self.renderer, mesh] for mesh in meshlist]
-            images = pool.map(singleRender, poolArg)
+            verts = torch.matmul(self.verts.expand(batch_size, -1, -1), R)
+            faces = self.faces.verts_idx.expand(batch_size, -1, -1)
+            atlas = self.atlas.expand(batch_size, *self.atlas.shape)
 
+            meshes = Meshes(verts=verts, faces=faces, textures=TexturesAtlas(atlas=atlas))
+
+            images = self.renderer(meshes)[..., :3].cpu()
+        if (uint8):
+            return (images*255).to(torch.uint8).numpy()
         return images
 
-def singleRender(arg):
-    return arg[0](arg[1])[0, ..., :3].squeeze().cpu()
+#############################################
+##         NumPy / PIL axis renderer       ##
+#############################################
+def loadObjTriangles(filepath):
+    colors = {}
+    verts = []
+    triangles = []
+    triangleColors = []
+    color = (0.5, 0.5, 0.5)
+
+    with open(filepath) as objFile:
+        for line in objFile:
+            parts = line.split()
+            if (not parts):
+                continue
+
+            if (parts[0] == 'mtllib'):
+                colors.update(loadMtlColors(os.path.join(os.path.dirname(filepath), ' '.join(parts[1:]))))
+            elif (parts[0] == 'usemtl'):
+                color = colors.get(parts[1], (0.5, 0.5, 0.5))
+            elif (parts[0] == 'v'):
+                verts.append([float(i) for i in parts[1:4]])
+            elif (parts[0] == 'f'):
+                face = [int(i.split('/')[0]) for i in parts[1:]]
+                face = [i-1 if i > 0 else len(verts)+i for i in face]
+                for index in range(1, len(face)-1):
+                    triangles.append([face[0], face[index], face[index+1]])
+                    triangleColors.append(color)
+
+    return np.array(verts, dtype=float), np.array(triangles, dtype=int).reshape(-1, 3), np.array(triangleColors, dtype=float).reshape(-1, 3)
+
+def loadMtlColors(filepath):
+    colors = {}
+    if (not os.path.isfile(filepath)):
+        return colors
+
+    name = None
+    with open(filepath) as mtlFile:
+        for line in mtlFile:
+            parts = line.split()
+            if (not parts):
+                continue
+            if (parts[0] == 'newmtl'):
+                name = ' '.join(parts[1:])
+            elif (parts[0] == 'Kd' and name is not None):
+                colors[name] = tuple(float(i) for i in parts[1:4])
+
+    return colors
+
+def lookAtCamera(dist, elev, azim):
+    # Same convention as pytorch3d look_at_view_transform: view = (world - eye) @ axes, +X left, +Y up, +Z forward
+    elev = np.radians(elev)
+    azim = np.radians(azim)
+    eye = dist*np.array([np.cos(elev)*np.sin(azim), np.sin(elev), np.cos(elev)*np.cos(azim)])
+
+    zAxis = -eye/np.linalg.norm(eye)
+    xAxis = np.cross([0, 1, 0], zAxis)
+    xAxis /= np.linalg.norm(xAxis)
+    yAxis = np.cross(zAxis, xAxis)
+
+    return eye, np.column_stack((xAxis, yAxis, zAxis))
+
+class ProjectedAxisScene:
+    # Flat-shaded painter's algorithm version of AxisScene for the small axis triad,
+    # lit like pytorch3d's default HardFlatShader and PointLights
+    lightLocation = np.array([0, 1, 0])
+    ambient = 0.5
+    diffuse = 0.3
+    specular = 0.2
+    shininess = 64
+
+    def __init__(self, filepath) -> None:
+        self.verts, self.triangles, self.colors = loadObjTriangles(filepath)
+        self.eye, self.axes = lookAtCamera(CAMERA_DIST, CAMERA_ELEV, CAMERA_AZIM)
+        self.focal = 1/np.tan(np.radians(CAMERA_FOV)/2)
+
+    def render(self, rotation, uint8=False):
+        verts = self.verts @ np.asarray(rotation, dtype=float)
+        corners = verts[self.triangles]
+        centers = corners.mean(axis=1)
+
+        normals = np.cross(corners[:, 1]-corners[:, 0], corners[:, 2]-corners[:, 0])
+        normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+
+        lightDir = self.lightLocation - centers
+        lightDir /= np.linalg.norm(lightDir, axis=1)[:, None]
+        viewDir = self.eye - centers
+        viewDir /= np.linalg.norm(viewDir, axis=1)[:, None]
+
+        cosAngle = np.einsum('ij,ij->i', normals, lightDir)
+        reflect = -lightDir + 2*np.maximum(cosAngle, 0)[:, None]*normals
+        specular = self.specular*np.maximum(np.einsum('ij,ij->i', reflect, viewDir), 0)**self.shininess*(cosAngle > 0)
+
+        shade = self.colors*(self.ambient + self.diffuse*np.maximum(cosAngle, 0))[:, None] + specular[:, None]
+        shade = (np.clip(shade, 0, 1)*255).astype(np.uint8)
+
+        view = (verts - self.eye) @ self.axes
+        ndc = self.focal*view[:, :2]/view[:, 2:]
+        pixels = (1 - ndc)*IMAGE_SIZE/2
+
+        image = Image.new('RGB', (IMAGE_SIZE, IMAGE_SIZE), (255, 255, 255))
+        draw = ImageDraw.Draw(image)
+
+        depth = view[self.triangles, 2].mean(axis=1)
+        trianglePixels = pixels[self.triangles].tolist()
+        shadeList = shade.tolist()
+        for index in np.argsort(-depth):
+            draw.polygon([tuple(point) for point in trianglePixels[index]], fill=tuple(shadeList[index]))
+
+        if (uint8):
+            return np.asarray(image)
+        return np.asarray(image, dtype=np.float32)/255
+
+    def renderBatch(self, rotations, uint8=False):
+        with instrumentation.span('render.renderBatch'):
+            return np.stack([self.render(rotation, uint8) for rotation in rotations])
+
+def toUint8(image):
+    if (np.asarray(image).dtype == np.uint8):
+        return np.asarray(image)
+    return (np.asarray(image) * 255).astype(np.uint8)
+
+def saveGif(frames, gifFilename, duration=100):
+    # Frames may be a generator, each one is palettized as it arrives so only 8-bit copies are held
+    images = [Image.fromarray(toUint8(frame)).convert('P', palette=Image.ADAPTIVE) for frame in frames]
+    images[0].save(gifFilename, save_all=True, append_images=images[1:], duration=duration)
+
+#############################################
+##        Render worker process state      ##
+#############################################
+workerScene = None
+
+def initRenderWorker(filepath):
+    global workerScene
+    workerScene = AxisScene(filepath)
+
+def renderRotationChunk(rotations, uint8=False):
+    return workerScene.renderBatch(rotations, uint8)
+
+class Obj_Renderer:
+    # backend: "pytorch3d" rasterizes in a worker pool (processes=0 keeps it in-process), "numpy" projects and draws in-process,
+    # "auto" uses pytorch3d when it is installed
+    def __init__(self, filepath, processes=None, chunkSize=16, backend="auto") -> None:
+        if (backend == "auto"):
+            backend = "pytorch3d" if importlib.util.find_spec("pytorch3d") else "numpy"
+        if (backend not in ("pytorch3d", "numpy")):
+            raise Exception(f"Unknown render backend {backend}")
+
+        self.filepath = filepath
+        self.processes = processes
+        self.chunkSize = chunkSize
+        self.backend = backend
+        self.scene = None
+        self.pool = None
+
+        self.start()
+
+    def start(self):
+        # processes=0 renders in the calling process, e.g. inside another pool's worker
+        if (self.backend == "numpy" or self.processes == 0):
+            if (self.scene is None):
+                self.scene = ProjectedAxisScene(self.filepath) if self.backend == "numpy" else AxisScene(self.filepath)
+            return
+
+        # Workers load the mesh and build the rasterizer/shader once, jobs only carry (3,3) matrices
+        if (self.pool is None):
+            self.pool = Pool(self.processes, initializer=initRenderWorker, initargs=(self.filepath,))
+
+    def render_image(self, rotations, progress_callback=None, cancel_token=None):
+        return list(self.render_frames(rotations, progress_callback=progress_callback, cancel_token=cancel_token))
+
+    def render_frames(self, rotations, chunkSize=None, uint8=False, progress_callback=None, cancel_token=None):
+        # Frames are yielded in order as soon as their chunk is rasterized. uint8=True yields (H,W,3) uint8
+        # frames converted where they were rendered, a quarter of the float size to pass between processes
+        self.start()
+
+        chunkSize = chunkSize or self.chunkSize
+        rotations = np.asarray(rotations, dtype=np.float32).reshape(-1, 3, 3)
+        chunks = [rotations[i:i+chunkSize] for i in range(0, len(rotations), chunkSize)]
+
+        if (self.scene is not None):
+            images = (self.scene.renderBatch(chunk, uint8) for chunk in chunks)
+        else:
+            images = self.pool.imap(partial(renderRotationChunk, uint8=uint8), chunks)
+
+        frameCount = 0
+        for chunkImages in images:
+            for image in chunkImages:
+                if (cancel_token is not None):
+                    cancel_token.check()
+
+                frameCount += 1
+                instrumentation.count('render.frames')
+                reportProgress(progress_callback, frameCount, len(rotations), f'Frame {frameCount}/{len(rotations)}')
+                yield image
+
+    def close(self):
+        if (self.pool is not None):
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -0,0 +1,232 @@
+import os
+import glob
+import hashlib
+import tempfile
+import numpy as np
+
+from jobControl import reportProgress
+
+COLUMNS = ["timestamp", "accelX", "accelY", "accelZ", "baselineX", "baselineY", "baselineZ", "gyroX", "gyroY", "gyroZ", "impactLevel"]
+TICK_SECONDS = 0.122*10**-3
+
+# A gap longer than this many median sample spacings is reported as a dropout
+DROPOUT_FACTOR = 3
+
+def umaskFileMode():
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+# Files written through mkstemp (created 0600) are given the mode open() would have used
+FILE_MODE = umaskFileMode()
+
+#############################################
+##                Time base                ##
+#############################################
+def tickWrap(maxTick):
+    # The counter width is not recorded, assume the smallest power of two that holds every tick
+    return 2.0**np.ceil(np.log2(maxTick+1))
+
+def unwrapTicks(ticks, wrap=None):
+    # A drop of more than half the counter range is a wraparound, smaller steps back are left alone
+    ticks = np.asarray(ticks, dtype=float)
+    if (len(ticks) < 2):
+        return ticks
+
+    steps = np.diff(ticks)
+    if (steps.min() >= 0):
+        return ticks
+
+    wrap = wrap or tickWrap(ticks.max())
+    wraps = steps < -wrap/2
+    if (not wraps.any()):
+        return ticks
+
+    return ticks + wrap*np.concatenate(([0], np.cumsum(wraps)))
+
+class TickClock:
+    # Seconds since the first tick for ticks that arrive in batches. The previous batch's last
+    # tick is carried so a wraparound on a batch boundary is unwrapped like one inside a batch,
+    # and the counter width comes from the largest tick seen so far rather than one batch.
+    def __init__(self) -> None:
+        self.firstTick = None
+        self.lastTick = None
+        self.maxTick = 0
+        self.tickOffset = 0
+
+    def seconds(self, rawTicks):
+        rawTicks = np.asarray(rawTicks, dtype=float)
+        self.maxTick = max(self.maxTick, rawTicks.max())
+        wrap = tickWrap(self.maxTick)
+
+        if (self.lastTick is None):
+            ticks = unwrapTicks(rawTicks, wrap)
+            self.firstTick = ticks[0]
+        else:
+            ticks = unwrapTicks(np.concatenate(([self.lastTick], rawTicks)), wrap)[1:] + self.tickOffset
+        self.lastTick = rawTicks[-1]
+        self.tickOffset = ticks[-1] - rawTicks[-1]
+
+        return (ticks - self.firstTick) * TICK_SECONDS
+
+def ticksToSeconds(ticks):
+    ticks = unwrapTicks(ticks)
+    # A file without a parseable row gives an empty time list
+    if (len(ticks) == 0):
+        return ticks
+    return (ticks - ticks[0]) * TICK_SECONDS
+
+def findDropouts(timeList, dropoutFactor=DROPOUT_FACTOR):
+    # Returns the index of the first sample after each gap and the gap length in seconds
+    steps = np.diff(np.asarray(timeList, dtype=float))
+    if (len(steps) == 0):
+        return np.empty(0, dtype=int), np.empty(0)
+
+    gaps = np.flatnonzero(steps > dropoutFactor*np.median(steps))
+    return gaps+1, steps[gaps]
+
+def resampleUniform(timeList, columns, sampleRate=None):
+    # Linear interpolation of every channel onto t0 + k*dt, dt from sampleRate or the median spacing.
+    # Dropouts are bridged by the interpolation, check findDropouts first if that matters.
+    timeList = np.asarray(timeList, dtype=float)
+    dt = 1/sampleRate if sampleRate else float(np.median(np.diff(timeList)))
+
+    grid = timeList[0] + dt*np.arange(int((timeList[-1]-timeList[0])/dt)+1)
+
+    resampled = {name: np.interp(grid, timeList, columns[name]) for name in COLUMNS if name != 'timestamp'}
+    resampled['timestamp'] = unwrapTicks(columns['timestamp'])[0] + (grid-grid[0])/TICK_SECONDS
+    resampled['time'] = grid
+
+    return resampled, dt
+
+def timeBase(columns, resample=False, sampleRate=None, dropoutFactor=DROPOUT_FACTOR):
+    # Adds a 'time' column in seconds and reports what the tick counter did. With resample every
+    # channel is moved onto a uniform grid and info["dt"] is the fixed step downstream stages can use.
+    rawTicks = np.asarray(columns['timestamp'], dtype=float)
+    ticks = unwrapTicks(rawTicks)
+    timeList = (ticks - ticks[0]) * TICK_SECONDS if len(ticks) else ticks
+
+    dropoutIndexs, dropoutGaps = findDropouts(timeList, dropoutFactor)
+    info = {"wraps": int(np.count_nonzero(np.diff(ticks - rawTicks))),
+            "backwardSteps": int(np.count_nonzero(np.diff(ticks) < 0)),
+            "dropouts": list(zip(timeList[dropoutIndexs].tolist(), dropoutGaps.tolist())),
+            "dt": None}
+
+    if (resample and len(timeList) > 1):
+        columns, info["dt"] = resampleUniform(timeList, columns, sampleRate)
+    else:
+        columns = dict(columns, time=timeList)
+
+    return columns, info
+
+def readCsv(filepath):
+    import pandas as pd
+
+    df = pd.read_csv(filepath, on_bad_lines='warn', skip_blank_lines=True, encoding='utf-8', encoding_errors='ignore', names=COLUMNS)
+    df = df.apply(pd.to_numeric, errors='coerce').dropna()
+
+    return {name: df[name].to_numpy(dtype=float) for name in COLUMNS}
+
+def iterCsvChunks(filepath, chunkSize=100000, progress_callback=None, cancel_token=None):
+    # Bounded-memory reader for recordings too large to load at once.
+    # Yields column dicts with an extra 'time' column in seconds from the first sample.
+    # Progress is the share of the file the parser has read, checked for cancel between chunks.
+    import pandas as pd
+
+    clock = TickClock()
+    fileSize = os.path.getsize(filepath)
+    with open(filepath, 'rb') as csvFile, pd.read_csv(csvFile, on_bad_lines='warn', skip_blank_lines=True, encoding='utf-8', encoding_errors='ignore', names=COLUMNS, chunksize=chunkSize) as reader:
+        for df in reader:
+            if (cancel_token is not None):
+                cancel_token.check()
+            reportProgress(progress_callback, csvFile.tell(), fileSize, f'Reading {os.path.basename(filepath)}')
+
+            df = df.apply(pd.to_numeric, errors='coerce').dropna()
+            if (len(df) == 0):
+                continue
+
+            columns = {name: df[name].to_numpy(dtype=float) for name in COLUMNS}
+
+            columns['time'] = clock.seconds(columns['timestamp'])
+
+            yield columns
+
+#############################################
+##          Columnar binary cache          ##
+#############################################
+# <dir>/.<name>.<key>.imu.npy holds an (11, N) float64 array, one contiguous row per column.
+# The key covers the source path, size and mtime, so an edited or replaced CSV is re-parsed.
+
+def cachePath(filepath):
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    key = hashlib.sha1(f'{filepath}|{stat.st_size}|{stat.st_mtime_ns}'.encode()).hexdigest()[:16]
+
+    return os.path.join(os.path.dirname(filepath), f'.{os.path.basename(filepath)}.{key}.imu.npy')
+
+def writeCache(filepath, columns):
+    cacheFile = cachePath(filepath)
+    directory = os.path.dirname(cacheFile)
+    pattern = os.path.join(directory, f'.{glob.escape(os.path.basename(filepath))}.*.imu.npy')
+
+    # Every writer fills a temp file of its own, two caching the same CSV each publish a whole file
+    try:
+        handle, tempFile = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(filepath)}.', suffix='.tmp')
+        os.close(handle)
+    except OSError as e:
+        print(f'Could not write session cache: {e}')
+        return
+
+    try:
+        data = np.lib.format.open_memmap(tempFile, mode='w+', dtype=np.float64, shape=(len(COLUMNS), len(columns[COLUMNS[0]])))
+        for row, name in enumerate(COLUMNS):
+            data[row] = columns[name]
+        data.flush()
+        del data
+
+        os.chmod(tempFile, FILE_MODE)
+        os.replace(tempFile, cacheFile)
+    except OSError as e:
+        print(f'Could not write session cache: {e}')
+        try:
+            os.remove(tempFile)
+        except OSError:
+            pass
+        return
+
+    # Caches of earlier versions of the CSV. One still mapped by a reader can't be removed on
+    # Windows, it is left for the next write.
+    for staleFile in glob.glob(pattern):
+        if (staleFile != cacheFile):
+            try:
+                os.remove(staleFile)
+            except OSError:
+                pass
+
+def readCache(filepath):
+    cacheFile = cachePath(filepath)
+    if (not os.path.isfile(cacheFile)):
+        return None
+
+    try:
+        data = np.load(cacheFile, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+    if (data.ndim != 2 or data.shape[0] != len(COLUMNS)):
+        return None
+
+    return {name: data[row] for row, name in enumerate(COLUMNS)}
+
+def loadSession(filepath, useCache=True):
+    if (useCache):
+        columns = readCache(filepath)
+        if (columns is not None):
+            return columns
+
+    columns = readCsv(filepath)
+
+    if (useCache and len(columns[COLUMNS[0]]) > 0):
+        writeCache(filepath, columns)
+
+    return columns
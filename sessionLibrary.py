@@ -0,0 +1,208 @@
+import os
+import glob
+import hashlib
+import tempfile
+import threading
+import numpy as np
+
+from jobControl import reportProgress
+from sessionIO import FILE_MODE
+
+SUMMARY_COLUMNS = ["peakTime", "maxYawSpeed", "speedAtHit", "angleAtHit"]
+TRACE_NAMES = ["accelMag", "gyroMag", "yawSpeed", "swingAngle"]
+
+# Traces are kept from TRACE_BEFORE s before the hit to TRACE_AFTER s after it, at TRACE_RATE Hz
+TRACE_BEFORE = 2.0
+TRACE_AFTER = 1.0
+TRACE_RATE = 100
+
+#############################################
+##            Per-swing summaries          ##
+#############################################
+# A summary is a dict of arrays with one row per swing: the SUMMARY_COLUMNS metrics (float64,
+# the same values batchProcess reports) and the TRACE_NAMES series resampled onto traceTime,
+# seconds relative to the hit (float32, NaN where the swing window does not reach).
+
+def traceTime():
+    return np.linspace(-TRACE_BEFORE, TRACE_AFTER, int((TRACE_BEFORE+TRACE_AFTER)*TRACE_RATE)+1)
+
+def hitTrace(timeList, values, hitTime, relativeTime):
+    values = np.asarray(values, dtype=float)
+    if (len(values) == 0):
+        return np.full(len(relativeTime), np.nan, dtype=np.float32)
+    timeList = np.asarray(timeList, dtype=float)[-len(values):]
+    return np.interp(hitTime + relativeTime, timeList, values, left=np.nan, right=np.nan).astype(np.float32)
+
+def summarizeSwings(timeList, accelList, gyroList, peakList, yawSpeeds, swingAngles):
+    # yawSpeeds / swingAngles are the per-swing yawSpeedFromMatrix / swingAngleFromMatrix series
+    relativeTime = traceTime()
+    columns = {name: np.empty(len(timeList)) for name in SUMMARY_COLUMNS}
+    traces = {name: np.empty((len(timeList), len(relativeTime)), dtype=np.float32) for name in TRACE_NAMES}
+
+    for swing in range(len(timeList)):
+        times = np.asarray(timeList[swing], dtype=float)
+        peak = peakList[swing]
+        yawSpeed = np.asarray(yawSpeeds[swing], dtype=float)
+        swingAngle = np.asarray(swingAngles[swing], dtype=float)
+
+        columns["peakTime"][swing] = times[peak]
+        # A swing too short for a yaw speed difference keeps its row, with NaN speeds
+        columns["maxYawSpeed"][swing] = yawSpeed.max() if len(yawSpeed) else np.nan
+        columns["speedAtHit"][swing] = yawSpeed[min(peak, len(yawSpeed)-1)] if len(yawSpeed) else np.nan
+        columns["angleAtHit"][swing] = swingAngle[peak]
+
+        # yaw speed is a difference series, it lines up with timeList[1:]
+        traces["accelMag"][swing] = hitTrace(times, accelList[swing][3], times[peak], relativeTime)
+        traces["gyroMag"][swing] = hitTrace(times, gyroList[swing][3], times[peak], relativeTime)
+        traces["yawSpeed"][swing] = hitTrace(times, yawSpeed, times[peak], relativeTime)
+        traces["swingAngle"][swing] = hitTrace(times, swingAngle, times[peak], relativeTime)
+
+    return dict(columns, traceTime=relativeTime, **traces)
+
+def summarizeSession(filepath, shoulderWidth=40.0, useCache=True, resampleHz=None):
+    # Runs the whole pipeline on one recording, for sessions that are not open in the app
+    from sessionIO import loadSession, timeBase
+    from swingAnalysis import swingDetection, yawSpeedFromMatrix, swingAngleFromMatrix, A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO
+    from positionTrack import QCompFilter
+
+    session = loadSession(filepath, useCache=useCache)
+    if (len(session['timestamp']) < 2):
+        raise Exception(f"{filepath} has no samples")
+
+    session, timeInfo = timeBase(session, resampleHz is not None, resampleHz)
+    dt = timeInfo['dt']
+
+    accelList, gyroList, timeList, peakList = swingDetection([session['accelX'], session['accelY'], session['accelZ']],
+                                                             [session['gyroX'], session['gyroY'], session['gyroZ']],
+                                                             session['time'], dt)
+
+    rotations = QCompFilter(A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO, False).batchApply(timeList, accelList, gyroList, dt=dt)
+    yawSpeeds = [yawSpeedFromMatrix(rotations[i], timeList[i], shoulderWidth, dt) for i in range(len(timeList))]
+    swingAngles = [swingAngleFromMatrix(rotations[i], np.array([[1],[0],[0]])) for i in range(len(timeList))]
+
+    return summarizeSwings(timeList, accelList, gyroList, peakList, yawSpeeds, swingAngles)
+
+#############################################
+##              Session library            ##
+#############################################
+# <directory>/<name>.<key>.swings.npz per recording, the key is a hash of the source path.
+# Each file holds the summary plus where it came from, so the library outlives the CSVs and a
+# source that has changed on disk (size or mtime) is summarized again by ensure().
+
+METADATA = ["source", "name", "sourceSize", "sourceMtime", "shoulderWidth", "swingCount"]
+
+class SessionLibrary:
+    def __init__(self, directory) -> None:
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        # Writers of the same entry can overlap (the app re-indexes after hit moves), the last one wins
+        self.writeLock = threading.Lock()
+        # entry path -> (entry mtime, summary)
+        self.loaded = {}
+
+    def entryPath(self, filepath):
+        filepath = os.path.abspath(filepath)
+        key = hashlib.sha1(filepath.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f'{os.path.basename(filepath)}.{key}.swings.npz')
+
+    def isCurrent(self, filepath):
+        entryPath = self.entryPath(filepath)
+        if (not os.path.isfile(entryPath)):
+            return False
+
+        stat = os.stat(filepath)
+        metadata = self.metadata(entryPath)
+        return metadata is not None and metadata["sourceSize"] == stat.st_size and metadata["sourceMtime"] == stat.st_mtime_ns
+
+    def add(self, filepath, summary, shoulderWidth):
+        filepath = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        entryPath = self.entryPath(filepath)
+
+        metadata = {"source": np.array(filepath),
+                    "name": np.array(os.path.splitext(os.path.basename(filepath))[0]),
+                    "sourceSize": np.array(stat.st_size),
+                    "sourceMtime": np.array(stat.st_mtime_ns),
+                    "shoulderWidth": np.array(float(shoulderWidth)),
+                    "swingCount": np.array(len(summary["peakTime"]))}
+
+        # Written aside and swapped in, a reader never sees half an entry
+        with self.writeLock:
+            handle, tempFile = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(handle, 'wb') as entryFile:
+                    np.savez(entryFile, **summary, **metadata)
+                os.chmod(tempFile, FILE_MODE)
+                os.replace(tempFile, entryPath)
+            except BaseException:
+                os.remove(tempFile)
+                raise
+
+            with self.lock:
+                self.loaded.pop(entryPath, None)
+
+        return entryPath
+
+    def metadata(self, entryPath):
+        try:
+            with np.load(entryPath) as entry:
+                return {name: entry[name].item() for name in METADATA}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def entries(self):
+        # Metadata of every stored session, oldest recording first
+        entries = []
+        for entryPath in glob.glob(os.path.join(glob.escape(self.directory), '*.swings.npz')):
+            metadata = self.metadata(entryPath)
+            if (metadata is not None):
+                entries.append(dict(metadata, entry=entryPath))
+
+        return sorted(entries, key=lambda entry: (entry["sourceMtime"], entry["name"]))
+
+    def load(self, entryPath):
+        mtime = os.stat(entryPath).st_mtime_ns
+        with self.lock:
+            cached = self.loaded.get(entryPath)
+            if (cached is not None and cached[0] == mtime):
+                return cached[1]
+
+        with np.load(entryPath) as entry:
+            summary = {name: entry[name] for name in entry.files}
+        for name in METADATA:
+            summary[name] = summary[name].item()
+
+        with self.lock:
+            self.loaded[entryPath] = (mtime, summary)
+        return summary
+
+    def ensure(self, filepath, shoulderWidth=40.0, useCache=True, resampleHz=None):
+        if (not self.isCurrent(filepath)):
+            self.add(filepath, summarizeSession(filepath, shoulderWidth, useCache, resampleHz), shoulderWidth)
+        return self.load(self.entryPath(filepath))
+
+    def ensureAll(self, filepaths, shoulderWidth=40.0, progress_callback=None, cancel_token=None):
+        # Summarizes every recording not already in the library, failures are returned not raised
+        failed = []
+        for index, filepath in enumerate(filepaths):
+            if (cancel_token is not None):
+                cancel_token.check()
+            reportProgress(progress_callback, index, len(filepaths), f'Indexing {os.path.basename(filepath)}')
+
+            try:
+                self.ensure(filepath, shoulderWidth)
+            except Exception as e:
+                print(f'Could not index {filepath}: {e}')
+                failed.append((filepath, str(e)))
+
+        return failed
+
+    def remove(self, entryPath):
+        with self.lock:
+            self.loaded.pop(entryPath, None)
+        try:
+            os.remove(entryPath)
+        except OSError:
+            pass
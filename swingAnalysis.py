@@ -0,0 +1,364 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+
+# Re-exported so scripts only need this module; scipy is imported on first use to keep import time low
+from quart import Quaternion, FastQuaternion, QuaternionArray
+from positionTrack import QCompFilter, jitAvailable, compiledFilterLoop
+
+# QCompFilter settings used by the app and the batch tool
+A_REFRENCE = [[0], [0], [-1]]
+ACCEL_RATIO = 0.8
+ACCEL_DISTRO = 0.1
+
+def warmImports():
+    # Lets a GUI pay the scipy import (and numba compile) cost in the background instead of on the first load
+    from scipy.signal import find_peaks
+    from scipy.spatial.transform import Rotation
+
+    if (jitAvailable()):
+        compiledFilterLoop()
+
+def magnitude(xList, yList, zList):
+    xList, yList, zList = (np.asarray(i, dtype=float) for i in (xList, yList, zList))
+    return np.sqrt(xList**2 + yList**2 + zList**2)
+
+def pairPeaks(accelPeakList, gyroPeakList, indexWindow):
+    if len(accelPeakList) > len(gyroPeakList):
+        largerList = accelPeakList
+        smallerList = gyroPeakList
+    else:
+        largerList = gyroPeakList
+        smallerList = accelPeakList
+
+    if len(largerList) == 0:
+        return np.array([])
+
+    # earliest peak of the other sensor within half a window, peaks without one are dropped
+    nearIndexs = np.searchsorted(largerList, smallerList - indexWindow/2, side='right')
+    matched = nearIndexs < len(largerList)
+    nearPeaks = largerList[np.minimum(nearIndexs, len(largerList)-1)]
+    matched &= nearPeaks < smallerList + indexWindow/2
+
+    return (smallerList[matched] + nearPeaks[matched])/2
+
+def cutSwing(accelLists, gyroLists, timeList, accelMagList, gyroMagList, peakIndex, indexWindow):
+    windowStart = max(int(peakIndex-indexWindow/2), 0)
+    windowEnd = int(peakIndex+indexWindow/2)
+
+    return ([accelLists[0][windowStart:windowEnd],
+             accelLists[1][windowStart:windowEnd],
+             accelLists[2][windowStart:windowEnd],
+             accelMagList[windowStart:windowEnd]],
+            [gyroLists[0][windowStart:windowEnd],
+             gyroLists[1][windowStart:windowEnd],
+             gyroLists[2][windowStart:windowEnd],
+             gyroMagList[windowStart:windowEnd]],
+            timeList[windowStart:windowEnd],
+            # a window clamped at the first sample would otherwise put the peak at -1
+            max(int(peakIndex-windowStart-1), 0))
+
+def swingDetection(accelLists, gyroLists, timeList, dt=None):
+    from scipy.signal import find_peaks
+
+    length = min(len(accelLists[0]), len(accelLists[1]), len(accelLists[2]), len(gyroLists[0]), len(gyroLists[1]), len(gyroLists[2]), len(timeList))
+    accelLists = [np.asarray(i, dtype=float)[:length] for i in accelLists[:3]]
+    gyroLists = [np.asarray(i, dtype=float)[:length] for i in gyroLists[:3]]
+    timeList = np.asarray(timeList, dtype=float)[:length]
+    # A file without parseable rows (or a single one) has no spacing to work from and no swings
+    if (length < 2):
+        return [], [], [], []
+
+    # dt is the fixed step of resampled data, otherwise the mean spacing
+    avgTime = dt or (timeList[-1] - timeList[0])/(length-1)
+
+    indexWindow = 5/avgTime
+
+    accelMagList = magnitude(*accelLists)
+    gyroMagList = magnitude(*gyroLists)
+
+    accelHeight = accelMagList.max()*0.4
+    gyroHeight = gyroMagList.max()*0.4
+    accelPeakList, _ = find_peaks(accelMagList, prominence=1, distance=indexWindow, height=accelHeight)
+    gyroPeakList, _ = find_peaks(gyroMagList, prominence=1, distance=indexWindow, height=gyroHeight)
+
+    peakList = pairPeaks(accelPeakList, gyroPeakList, indexWindow)
+
+    newAccelList = []
+    newGyroList = []
+    newTimeList = []
+    newPeakList = []
+
+    for peakIndex in peakList:
+        accel, gyro, time, peak = cutSwing(accelLists, gyroLists, timeList, accelMagList, gyroMagList, peakIndex, indexWindow)
+        newAccelList.append(accel)
+        newGyroList.append(gyro)
+        newTimeList.append(time)
+        newPeakList.append(peak)
+
+    return newAccelList, newGyroList, newTimeList, newPeakList
+
+# time, accel xyz, gyro xyz, accel magnitude, gyro magnitude
+BUFFER_ROWS = 9
+
+# Fraction of a swing window (~0.3 s at the default 5 s) the streaming search region grows by
+# before peaks are looked for again
+SEARCH_STEP = 1/16
+
+class StreamingSwingDetector:
+    # Incremental swingDetection: push sample chunks and get back each swing as soon as
+    # the trailing half of its window has arrived. Only a couple of windows of samples are
+    # kept. Peak heights are relative to the largest magnitude seen so far, not the whole
+    # recording, so the first swings of a session may pass a lower threshold than in batch mode.
+    # Without a fixed avgTime the sample spacing is a running mean over everything pushed, and
+    # nothing is detected until rateTime seconds have arrived: tick rounding makes the spacing
+    # of the first few samples a poor estimate.
+    def __init__(self, avgTime=None, windowTime=5, heightRatio=0.4, rateTime=1.0, capacity=8192) -> None:
+        self.avgTime = avgTime
+        self.fixedRate = avgTime is not None
+        self.windowTime = windowTime
+        self.heightRatio = heightRatio
+        self.rateTime = rateTime
+
+        self.firstTime = None
+        self.lastTime = None
+        self.sampleCount = 0
+
+        # Ring buffer of time, accel xyz, gyro xyz, accel and gyro magnitude. Sample i is stored at
+        # i % capacity and again capacity further on, so any run of kept samples is one slice.
+        self.capacity = capacity
+        self.buffer = np.empty((BUFFER_ROWS, 2*capacity))
+        # Samples [start, end) are kept, peaks up to searched have been looked for
+        self.start = 0
+        self.end = 0
+        self.searched = -1
+
+        self.lastPeak = -np.inf
+        self.accelMax = 0
+        self.gyroMax = 0
+        # Last sample above the peak height at the time it was pushed, heights only grow
+        self.accelHigh = -np.inf
+        self.gyroHigh = -np.inf
+
+    @property
+    def indexWindow(self):
+        return self.windowTime/self.avgTime
+
+    def push(self, timeChunk, accelChunk, gyroChunk):
+        timeChunk = np.asarray(timeChunk, dtype=float)
+        accelChunk = [np.asarray(i, dtype=float) for i in accelChunk[:3]]
+        gyroChunk = [np.asarray(i, dtype=float) for i in gyroChunk[:3]]
+
+        if (len(timeChunk) == 0):
+            return []
+
+        self.append(timeChunk, accelChunk, gyroChunk)
+
+        if (not self.fixedRate):
+            self.updateRate(timeChunk)
+            if (self.avgTime is None or self.lastTime - self.firstTime < self.rateTime):
+                return []
+
+        return self.detect(final=False)
+
+    def updateRate(self, timeChunk):
+        if (self.firstTime is None):
+            self.firstTime = timeChunk[0]
+        self.lastTime = timeChunk[-1]
+        self.sampleCount += len(timeChunk)
+
+        if (self.sampleCount > 1):
+            self.avgTime = (self.lastTime - self.firstTime)/(self.sampleCount-1)
+
+    def flush(self):
+        if (self.avgTime is None or self.end == self.start):
+            return []
+        return self.detect(final=True)
+
+    def samples(self, start, end):
+        first = start % self.capacity
+        return self.buffer[:, first:first+end-start]
+
+    def append(self, timeChunk, accelChunk, gyroChunk):
+        accelMagChunk = magnitude(*accelChunk)
+        gyroMagChunk = magnitude(*gyroChunk)
+
+        self.accelMax = max(self.accelMax, accelMagChunk.max())
+        self.gyroMax = max(self.gyroMax, gyroMagChunk.max())
+
+        accelHigh = np.flatnonzero(accelMagChunk >= self.accelMax*self.heightRatio)
+        if (len(accelHigh)):
+            self.accelHigh = self.end + accelHigh[-1]
+        gyroHigh = np.flatnonzero(gyroMagChunk >= self.gyroMax*self.heightRatio)
+        if (len(gyroHigh)):
+            self.gyroHigh = self.end + gyroHigh[-1]
+
+        length = len(timeChunk)
+        if (self.end + length - self.start > self.capacity):
+            self.grow(self.end + length - self.start)
+
+        self.store(self.end, np.vstack((timeChunk, *accelChunk, *gyroChunk, accelMagChunk, gyroMagChunk)))
+        self.end += length
+
+    def store(self, position, data):
+        # data's columns are samples position, position+1, ..., written to both halves
+        first = position % self.capacity
+        split = min(data.shape[1], self.capacity - first)
+        for offset in (0, self.capacity):
+            self.buffer[:, offset+first:offset+first+split] = data[:, :split]
+            self.buffer[:, offset:offset+data.shape[1]-split] = data[:, split:]
+
+    def grow(self, needed):
+        # Only while the rate is unknown or for chunks longer than the buffer
+        kept = self.samples(self.start, self.end).copy()
+        self.capacity = max(2*self.capacity, needed)
+        self.buffer = np.empty((BUFFER_ROWS, 2*self.capacity))
+        self.store(self.start, kept)
+
+    def detect(self, final):
+        from scipy.signal import find_peaks
+
+        indexWindow = self.indexWindow
+        # Swings whose trailing half window has arrived. The region grows by at least SEARCH_STEP of
+        # a window between searches, so tiny live chunks do not each cost a search.
+        searchEnd = self.end if final else self.end - indexWindow/2
+        if (searchEnd <= self.searched or (not final and searchEnd - self.searched < SEARCH_STEP*indexWindow)):
+            return []
+
+        swings = []
+        # A pair peaking after searched has both sensors above their heights within a quarter window
+        # of it. Quiet chunks skip find_peaks, otherwise it runs over the new region plus half a window.
+        if (min(self.accelHigh, self.gyroHigh) >= self.searched - indexWindow/2):
+            segmentStart = max(self.start, int(self.searched - indexWindow/2))
+            segment = self.samples(segmentStart, self.end)
+
+            accelPeakList, _ = find_peaks(segment[7], prominence=1, distance=indexWindow, height=self.accelMax*self.heightRatio)
+            gyroPeakList, _ = find_peaks(segment[8], prominence=1, distance=indexWindow, height=self.gyroMax*self.heightRatio)
+
+            for peakIndex in pairPeaks(accelPeakList, gyroPeakList, indexWindow):
+                peak = peakIndex + segmentStart
+                if (peak <= self.searched or peak <= self.lastPeak + indexWindow/2):
+                    continue
+                if (peak > searchEnd):
+                    break
+
+                accel, gyro, time, peak = cutSwing(segment[1:4], segment[4:7], segment[0], segment[7], segment[8], peakIndex, indexWindow)
+                swings.append(([i.copy() for i in accel], [i.copy() for i in gyro], time.copy(), peak))
+                self.lastPeak = peakIndex + segmentStart
+
+        # keep the leading half-window of any later peak
+        self.searched = searchEnd
+        self.start = min(max(self.start, int(self.searched - indexWindow/2) - 1), self.end)
+
+        return swings
+
+def streamSwingDetection(chunks, detector=None):
+    detector = detector or StreamingSwingDetector()
+
+    newAccelList = []
+    newGyroList = []
+    newTimeList = []
+    newPeakList = []
+
+    def collect(swings):
+        for accel, gyro, time, peak in swings:
+            newAccelList.append(accel)
+            newGyroList.append(gyro)
+            newTimeList.append(time)
+            newPeakList.append(peak)
+
+    for chunk in chunks:
+        collect(detector.push(chunk['time'],
+                              [chunk['accelX'], chunk['accelY'], chunk['accelZ']],
+                              [chunk['gyroX'], chunk['gyroY'], chunk['gyroZ']]))
+    collect(detector.flush())
+
+    return newAccelList, newGyroList, newTimeList, newPeakList
+
+def yawSpeedFromMatrix(matrixList, timeList, shoulderWidth, dt=None):
+    from scipy.spatial.transform import Rotation
+
+    eularRot = Rotation.from_matrix(np.asarray(matrixList)).as_euler('xyz', degrees=False)
+    timeList = np.asarray(timeList, dtype=float)
+    length = min(len(eularRot), len(timeList))
+
+    return 0.005*shoulderWidth*np.abs(np.diff(eularRot[:length, 1])/(np.diff(timeList[:length]) if dt is None else dt))
+
+def swingAngleFromMatrix(matrixList, refrenceVector):
+    gVector = np.array([0, -1, 0])
+    cosAngle = np.einsum('nij,j,i->n', np.asarray(matrixList), gVector, np.ravel(refrenceVector))
+
+    return np.arccos(np.clip(cosAngle, -1, 1))*180/np.pi
+
+class SwingResults:
+    # Derived per-swing series, computed on first access and memoized by swing index and
+    # parameters. Neighbouring swings are prefetched on a background thread.
+    def __init__(self, rotations, timeList, shoulderWidth, refrenceVector=np.array([[1],[0],[0]]), dt=None) -> None:
+        self.rotations = rotations
+        self.timeList = timeList
+        self.dt = dt
+        self.shoulderWidth = shoulderWidth
+        self.refrenceVector = refrenceVector
+
+        self.results = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def __len__(self):
+        return len(self.rotations)
+
+    def setShoulderWidth(self, shoulderWidth):
+        # Yaw speeds for the old width are not shown again
+        with self.lock:
+            self.shoulderWidth = shoulderWidth
+            self.results = {key: value for key, value in self.results.items() if key[0] != 'yaw' or key[2] == shoulderWidth}
+
+    def yawSpeeds(self, index, shoulderWidth=None):
+        shoulderWidth = self.shoulderWidth if shoulderWidth is None else shoulderWidth
+        # Only the current width is memoized
+        if (shoulderWidth != self.shoulderWidth):
+            return yawSpeedFromMatrix(self.rotations[index], self.timeList[index], shoulderWidth, self.dt)
+        return self.get(('yaw', index, shoulderWidth), yawSpeedFromMatrix, self.rotations[index], self.timeList[index], shoulderWidth, self.dt)
+
+    def swingAngles(self, index):
+        return self.get(('angle', index), swingAngleFromMatrix, self.rotations[index], self.refrenceVector)
+
+    def get(self, key, fn, *args):
+        with self.lock:
+            if (key in self.results):
+                return self.results[key]
+
+            future = self.pending.get(key)
+            owner = future is None
+            if (owner):
+                future = Future()
+                self.pending[key] = future
+
+        if (not owner):
+            return future.result()
+
+        try:
+            result = fn(*args)
+        except Exception as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+
+        # Stored before the pending entry goes, a get in between would otherwise compute it again
+        with self.lock:
+            self.results[key] = result
+            del self.pending[key]
+        future.set_result(result)
+
+        return result
+
+    def prefetch(self, index):
+        for neighbour in (index+1, index-1):
+            if (0 <= neighbour < len(self)):
+                self.executor.submit(self.yawSpeeds, neighbour)
+                self.executor.submit(self.swingAngles, neighbour)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
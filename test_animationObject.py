@@ -0,0 +1,76 @@
+import pytest
+from PyQt5.QtCore import QCoreApplication
+
+import animationObject
+from animationObject import FrameScheduler
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class RecordingAnimation:
+    def __init__(self) -> None:
+        self.shown = []
+        self.stopped = False
+
+    def displayFrame(self, frameNum):
+        self.shown.append(frameNum)
+
+    def playbackStopped(self):
+        self.stopped = True
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(animationObject.time, 'perf_counter', clock)
+    return clock
+
+@pytest.fixture
+def scheduler():
+    # Timers need an application object, the test drives tick() itself
+    app = QCoreApplication.instance() or QCoreApplication([])
+    scheduler = FrameScheduler(delay=100)
+    yield scheduler
+    scheduler.stop()
+
+def test_late_frames_are_dropped_not_queued(clock, scheduler):
+    animation = RecordingAnimation()
+    scheduler.play(animation, 0, 50)
+    assert animation.shown == [0]
+
+    # Three and a half frame times later only the frame due now is shown
+    clock.now += 0.35
+    scheduler.tick()
+    assert animation.shown == [0, 3]
+    assert scheduler.droppedFrames == 2
+
+    # The next tick on time shows the next frame, nothing skipped is caught up
+    clock.now += 0.1
+    scheduler.tick()
+    assert animation.shown == [0, 3, 4]
+    assert scheduler.droppedFrames == 2
+
+def test_early_tick_shows_nothing(clock, scheduler):
+    animation = RecordingAnimation()
+    scheduler.play(animation, 10, 50)
+
+    clock.now += 0.05
+    scheduler.tick()
+    assert animation.shown == [10]
+    assert scheduler.droppedFrames == 0
+
+def test_late_tick_stops_at_the_last_frame(clock, scheduler):
+    animation = RecordingAnimation()
+    scheduler.play(animation, 0, 5)
+
+    clock.now += 10
+    scheduler.tick()
+    assert animation.shown == [0, 5]
+    assert scheduler.droppedFrames == 4
+
+    scheduler.stop(animation)
+    assert animation.stopped
+    assert scheduler.animation is None
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pytest
+
+from frameCache import FrameCache
+
+FRAME_SHAPE = (16, 16, 3)
+FRAME_BYTES = int(np.prod(FRAME_SHAPE))
+
+def makeFrames(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, FRAME_SHAPE, dtype=np.uint8) for _ in range(count)]
+
+def spillFiles(cache):
+    return sorted(os.listdir(cache.directory))
+
+@pytest.fixture
+def cache(tmp_path):
+    # Room for four decoded frames
+    cache = FrameCache(budgetBytes=4*FRAME_BYTES, directory=str(tmp_path))
+    yield cache
+    cache.close()
+
+def test_evicted_frames_come_back_from_the_spill_file(cache):
+    frames = makeFrames(10)
+    for stored, frame in zip(cache.storeFrames('swing', frames), frames):
+        assert np.array_equal(stored, frame)
+
+    assert cache.frameCount('swing') == 10
+    assert cache.usedBytes <= cache.budgetBytes
+    assert len(cache.frames) == 4
+    assert ('swing', 0) not in cache.frames
+
+    for index, frame in enumerate(frames):
+        cached = cache.getFrame('swing', index)
+        assert cached.dtype == np.uint8
+        assert cached.shape == FRAME_SHAPE
+        assert np.array_equal(cached, frame)
+        assert cache.usedBytes <= cache.budgetBytes
+
+def test_iter_frames_leaves_the_cache_alone(cache):
+    frames = makeFrames(6)
+    for _ in cache.storeFrames('swing', frames):
+        pass
+    cached = list(cache.frames)
+
+    for exported, frame in zip(cache.iterFrames('swing'), frames):
+        assert np.array_equal(exported, frame)
+    assert list(cache.frames) == cached
+
+def test_discard_removes_the_spill_file(cache):
+    for _ in cache.storeFrames('first', makeFrames(3)):
+        pass
+    for _ in cache.storeFrames('second', makeFrames(3, seed=1)):
+        pass
+    assert len(spillFiles(cache)) == 2
+
+    cache.discard('first')
+
+    assert len(spillFiles(cache)) == 1
+    assert cache.frameCount('first') == 0
+    assert all(key != 'first' for key, _ in cache.frames)
+    assert cache.usedBytes == sum(frame.nbytes for frame in cache.frames.values())
+    with pytest.raises(Exception):
+        cache.getFrame('first', 0)
+
+def test_restoring_a_key_replaces_its_frames(cache):
+    for _ in cache.storeFrames('swing', makeFrames(3)):
+        pass
+    frames = makeFrames(2, seed=1)
+    for _ in cache.storeFrames('swing', frames):
+        pass
+
+    assert len(spillFiles(cache)) == 1
+    assert cache.frameCount('swing') == 2
+    for index, frame in enumerate(frames):
+        assert np.array_equal(cache.getFrame('swing', index), frame)
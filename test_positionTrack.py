@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from quart import Quaternion
+from benchmark import synthesizeSession
+from sessionIO import ticksToSeconds
+from swingAnalysis import swingDetection, A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO
+from positionTrack import QCompFilter, QCompFilterStream, jitAvailable
+
+#############################################
+##        Reference per-sample filter      ##
+#############################################
+# The original QCompFilter.applyData loop, kept as written so the vectorized and compiled
+# kernels can be checked against it. Squares round differently from the per-sample ** (x*x
+# against libm pow), so results agree to a few ulp rather than bit for bit.
+
+def referenceEtoQ(e) -> Quaternion:
+    eT = [i[0] for i in e]
+    q = 1 / np.sqrt(4 + sum([i**2 for i in eT]))
+    return Quaternion(2*q, [q*i for i in eT])
+
+def referenceQtoE(q: Quaternion):
+    return [[2*i/q.q0] for i in q.q]
+
+def referenceApplyData(aRef, accelRatio, accelDistro, timeList, accelList, gyroList):
+    aRef = np.array([aRef[1], aRef[2], [-aRef[0][0]]])
+
+    firstAccel = np.array([[accelList[1][0]],
+                           [accelList[2][0]],
+                           [-accelList[0][0]]])
+    a_mag = np.sqrt(sum([i[0]**2 for i in firstAccel]))
+    ak_norm = firstAccel/a_mag
+    a_angle = np.arccos(sum([a*b for a,b in zip(aRef, ak_norm)])[0])
+    a_axis = np.cross(aRef.T, ak_norm.T)[0]
+    qList = [referenceEtoQ(referenceQtoE(Quaternion(np.cos(a_angle/2), [i*np.sin(a_angle/2) for i in a_axis])))]
+
+    for i in range(0, len(timeList)-1):
+        q_previous = qList[-1]
+        dt = (timeList[i+1] - timeList[i])
+
+        wk = np.array([[gyroList[1][i+1] * np.pi/180],
+                       [gyroList[2][i+1] * np.pi/180],
+                       [-gyroList[0][i+1] * np.pi/180]])
+
+        ak = np.array([[accelList[1][i+1]],
+                       [accelList[2][i+1]],
+                       [-accelList[0][i+1]]])
+
+        w_mag = np.sqrt(sum([i[0]**2 for i in wk]))
+        w_angle = w_mag*dt/2
+
+        if w_mag == 0:
+            w_delta = Quaternion(np.cos(w_angle), [0.0 ,0.0 ,0.0])
+        else:
+            w_delta = Quaternion(np.cos(w_angle), [i[0]*np.sin(w_angle)/w_mag for i in wk])
+
+        w_q = q_previous * w_delta
+
+        a_mag = np.sqrt(sum([i[0]**2 for i in ak]))
+        ak_norm = ak/a_mag
+
+        a_angle = np.arccos(sum([a*b for a,b in zip(aRef, ak_norm)])[0])
+        a_axis = np.cross(aRef.T, ak_norm.T)[0]
+
+        a_q = Quaternion(np.cos(a_angle/2), [i*np.sin(a_angle/2) for i in a_axis])
+
+        accelProportion = accelRatio*np.exp(-0.5*((accelList[3][i+1]-1)/accelDistro)**2)
+        adjusted_q = (1-accelProportion) * w_q + accelProportion * a_q
+
+        qList.append(referenceEtoQ(referenceQtoE(adjusted_q)))
+
+    return np.array([np.array(i.toR()) for i in qList])
+
+#############################################
+##                  Tests                  ##
+#############################################
+@pytest.fixture(scope="module")
+def swing():
+    # 2000 samples around the first synthetic swing: rest, backswing, downswing and impact
+    session = synthesizeSession(seconds=12, sampleRate=1000, swingCount=2)
+    accelList, gyroList, timeList, peakList = swingDetection([session['accelX'], session['accelY'], session['accelZ']],
+                                                             [session['gyroX'], session['gyroY'], session['gyroZ']],
+                                                             ticksToSeconds(session['timestamp']))
+    window = slice(peakList[0]-1500, peakList[0]+500)
+    return timeList[0][window], [i[window] for i in accelList[0]], [i[window] for i in gyroList[0]]
+
+@pytest.fixture(scope="module")
+def reference(swing):
+    return referenceApplyData(A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO, *swing)
+
+# Rotation matrix entries are in [-1, 1]
+ULP_TOLERANCE = 4*np.finfo(float).eps
+
+KERNELS = ["numpy", pytest.param("numba", marks=pytest.mark.skipif(not jitAvailable(), reason="numba is not installed"))]
+
+@pytest.mark.parametrize("kernel", KERNELS)
+def test_apply_data_matches_reference(swing, reference, kernel):
+    filterObject = QCompFilter(A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO, False, kernel)
+    np.testing.assert_allclose(np.asarray(filterObject.applyData(*swing)), reference, rtol=0, atol=ULP_TOLERANCE)
+
+@pytest.mark.parametrize("kernel", KERNELS)
+def test_stream_matches_reference(swing, reference, kernel):
+    timeList, accelList, gyroList = swing
+    accelArray = np.column_stack(accelList[:3])
+    gyroArray = np.column_stack(gyroList[:3])
+
+    stream = QCompFilterStream(QCompFilter(A_REFRENCE, ACCEL_RATIO, ACCEL_DISTRO, False, kernel))
+    bounds = [0, 1, 2, 9, 300, 301, 1200, len(timeList)]
+    rotations = np.concatenate([stream.update(timeList[start:end], accelArray[start:end], gyroArray[start:end], accelList[3][start:end])
+                                for start, end in zip(bounds[:-1], bounds[1:])])
+
+    np.testing.assert_allclose(rotations, reference, rtol=0, atol=ULP_TOLERANCE)
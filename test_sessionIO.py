@@ -0,0 +1,133 @@
+import os
+import glob
+import numpy as np
+import pytest
+
+from sessionIO import COLUMNS, TICK_SECONDS, cachePath, readCache, loadSession, FILE_MODE, unwrapTicks, findDropouts, resampleUniform, timeBase, TickClock
+
+def writeCsv(filepath, length, seed=0):
+    rng = np.random.default_rng(seed)
+    data = np.column_stack((12345 + 8*np.arange(length), rng.normal(0, 1, (length, len(COLUMNS)-1))))
+    np.savetxt(filepath, data, delimiter=',', fmt='%.6f')
+    return data
+
+def cacheFiles(filepath):
+    return glob.glob(os.path.join(os.path.dirname(filepath), f'.{os.path.basename(filepath)}.*'))
+
+def tickSession(ticks):
+    ticks = np.asarray(ticks, dtype=float)
+    columns = {name: np.arange(len(ticks), dtype=float) for name in COLUMNS}
+    columns['timestamp'] = ticks
+    return columns
+
+@pytest.fixture
+def csvFile(tmp_path):
+    filepath = str(tmp_path / 'session.csv')
+    writeCsv(filepath, 500)
+    return filepath
+
+def test_cache_round_trip(csvFile):
+    parsed = loadSession(csvFile)
+    assert cacheFiles(csvFile) == [cachePath(csvFile)]
+
+    cached = readCache(csvFile)
+    assert cached is not None
+    for name in COLUMNS:
+        assert np.array_equal(cached[name], parsed[name])
+
+    # the temp file was published with the usual mode, not mkstemp's 0600
+    if (os.name == 'posix'):
+        assert os.stat(cachePath(csvFile)).st_mode & 0o777 == FILE_MODE
+
+def test_cache_key_follows_source_size_and_mtime(csvFile):
+    loadSession(csvFile)
+    firstKey = cachePath(csvFile)
+
+    stat = os.stat(csvFile)
+    os.utime(csvFile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cachePath(csvFile) != firstKey
+    assert readCache(csvFile) is None
+
+    writeCsv(csvFile, 600, seed=1)
+    assert cachePath(csvFile) != firstKey
+    assert len(loadSession(csvFile)['timestamp']) == 600
+
+def test_stale_cache_is_removed(csvFile):
+    loadSession(csvFile)
+    staleFile = cachePath(csvFile)
+
+    writeCsv(csvFile, 600, seed=1)
+    loadSession(csvFile)
+
+    assert not os.path.exists(staleFile)
+    assert cacheFiles(csvFile) == [cachePath(csvFile)]
+
+def test_unwrap_at_a_power_of_two_boundary():
+    # A 16 bit counter, the last tick before the wrap is 2**16-1
+    ticks = (np.arange(65500, 65600, 8) % 2**16).astype(float)
+    unwrapped = unwrapTicks(ticks)
+
+    assert np.array_equal(unwrapped, np.arange(65500, 65600, 8))
+    assert np.array_equal(unwrapTicks(ticks, 2**16), unwrapped)
+
+def test_unwrap_leaves_small_backward_steps():
+    ticks = np.array([1000, 1008, 1004, 1016, 1024], dtype=float)
+    assert np.array_equal(unwrapTicks(ticks), ticks)
+    assert len(unwrapTicks([])) == 0
+
+def test_tick_clock_unwraps_on_batch_boundaries():
+    ticks = (np.arange(65000, 66000, 8) % 2**16).astype(float)
+    # The wrap falls between two batches
+    wrapIndex = int(np.argmin(ticks))
+    clock = TickClock()
+    seconds = np.concatenate([clock.seconds(ticks[:5]), clock.seconds(ticks[5:wrapIndex]), clock.seconds(ticks[wrapIndex:])])
+
+    assert np.allclose(seconds, 8*TICK_SECONDS*np.arange(len(ticks)))
+
+def test_find_dropouts():
+    timeList = np.arange(100)*0.001
+    timeList[60:] += 0.05
+
+    indexs, gaps = findDropouts(timeList)
+    assert indexs.tolist() == [60]
+    assert np.allclose(gaps, [0.051])
+
+    assert len(findDropouts(timeList[:1])[0]) == 0
+    assert len(findDropouts(np.arange(100)*0.001)[0]) == 0
+
+def test_resample_uniform():
+    ticks = 8*np.arange(200) + np.tile([0, 1, 0, -1], 50)
+    columns = tickSession(ticks)
+    columns['accelX'] = 2*ticks*TICK_SECONDS
+    timeList = (ticks - ticks[0])*TICK_SECONDS
+
+    resampled, dt = resampleUniform(timeList, columns, sampleRate=1000)
+    assert dt == 0.001
+    assert np.allclose(np.diff(resampled['time']), dt)
+    assert resampled['time'][0] == 0 and resampled['time'][-1] <= timeList[-1]
+    # a linear channel is unchanged by linear interpolation
+    assert np.allclose(resampled['accelX'], 2*resampled['time'] + columns['accelX'][0])
+    assert np.allclose((resampled['timestamp'] - ticks[0])*TICK_SECONDS, resampled['time'])
+
+    # without a rate the step is the median spacing, jitter of a tick either way does not move it
+    ticks = 8*np.arange(201) + np.tile([0, 1, 0, -1], 51)[:201]
+    assert np.isclose(resampleUniform((ticks - ticks[0])*TICK_SECONDS, tickSession(ticks))[1], 8*TICK_SECONDS)
+
+def test_time_base_reports_wraps_and_dropouts():
+    ticks = 65000 + 8*np.arange(300)
+    ticks[200:] += 400
+    info = timeBase(tickSession(ticks % 2**16))[1]
+
+    assert info['wraps'] == 1
+    assert info['backwardSteps'] == 0
+    assert len(info['dropouts']) == 1
+    assert np.isclose(info['dropouts'][0][1], 408*TICK_SECONDS)
+    assert info['dt'] is None
+
+@pytest.mark.parametrize("length", [0, 1])
+@pytest.mark.parametrize("resample", [False, True])
+def test_time_base_without_samples(length, resample):
+    columns, info = timeBase(tickSession(8*np.arange(length)), resample, 1000)
+
+    assert len(columns['time']) == length
+    assert info == {"wraps": 0, "backwardSteps": 0, "dropouts": [], "dt": None}
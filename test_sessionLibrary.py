@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import pytest
+
+from sessionIO import FILE_MODE
+from sessionLibrary import SessionLibrary, summarizeSwings, traceTime, SUMMARY_COLUMNS, TRACE_NAMES
+
+def makeSwing(length, peak, sampleRate=1000.0):
+    times = np.arange(length)/sampleRate
+    magnitude = np.exp(-((np.arange(length)-peak)/20.0)**2)
+    return times, [None, None, None, magnitude], [None, None, None, 2*magnitude]
+
+@pytest.fixture
+def summary():
+    times, accel, gyro = makeSwing(2000, 1500)
+    shortTimes, shortAccel, shortGyro = makeSwing(1, 0)
+    # The second swing is a single sample, its yaw speed (a difference series) is empty
+    return summarizeSwings([times, shortTimes], [accel, shortAccel], [gyro, shortGyro], [1500, 0],
+                           [np.linspace(0, 30, 1999), np.empty(0)], [np.linspace(0, 90, 2000), np.zeros(1)])
+
+def test_summary_of_a_swing_without_yaw_speed(summary):
+    relativeTime = traceTime()
+    for name in SUMMARY_COLUMNS:
+        assert summary[name].shape == (2,)
+    for name in TRACE_NAMES:
+        assert summary[name].shape == (2, len(relativeTime))
+
+    assert summary["maxYawSpeed"][0] == 30
+    assert np.isnan(summary["maxYawSpeed"][1])
+    assert np.isnan(summary["speedAtHit"][1])
+    assert np.isnan(summary["yawSpeed"][1]).all()
+    assert summary["angleAtHit"][1] == 0
+    # the hit itself is the only point the single-sample swing covers
+    assert np.isfinite(summary["accelMag"][1]).sum() == 1
+
+def test_entry_round_trip(tmp_path, summary):
+    sourceFile = tmp_path / 'session.csv'
+    sourceFile.write_text('0\n')
+    library = SessionLibrary(str(tmp_path / 'library'))
+
+    entryPath = library.add(str(sourceFile), summary, 42.0)
+    assert library.isCurrent(str(sourceFile))
+    assert [entry["entry"] for entry in library.entries()] == [entryPath]
+    assert [name for name in os.listdir(library.directory)] == [os.path.basename(entryPath)]
+    # published with the usual mode, not mkstemp's 0600
+    if (os.name == 'posix'):
+        assert os.stat(entryPath).st_mode & 0o777 == FILE_MODE
+
+    loaded = library.load(entryPath)
+    assert loaded["shoulderWidth"] == 42.0
+    assert loaded["swingCount"] == 2
+    for name in SUMMARY_COLUMNS + TRACE_NAMES:
+        assert np.array_equal(loaded[name], summary[name], equal_nan=True)
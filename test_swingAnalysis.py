@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from benchmark import synthesizeSession
+from sessionIO import ticksToSeconds
+from swingAnalysis import swingDetection, StreamingSwingDetector, pairPeaks, cutSwing
+
+def streamSwings(timeList, accelLists, gyroLists, chunkBounds):
+    detector = StreamingSwingDetector()
+    swings = []
+    for start, end in zip(chunkBounds[:-1], chunkBounds[1:]):
+        swings += detector.push(timeList[start:end], [i[start:end] for i in accelLists], [i[start:end] for i in gyroLists])
+    return swings + detector.flush()
+
+@pytest.mark.parametrize("sampleRate", [1000.0, 833.0])
+@pytest.mark.parametrize("firstChunk", [1, 2, 5])
+def test_streaming_matches_batch_with_tiny_first_chunk(sampleRate, firstChunk):
+    # Live sources often deliver their first batch as a couple of rows, the sample spacing of
+    # those (rounded to sensor ticks) must not set the swing window for the whole session
+    session = synthesizeSession(seconds=40, sampleRate=sampleRate, swingCount=5)
+    timeList = ticksToSeconds(session['timestamp'])
+    accelLists = [session['accelX'], session['accelY'], session['accelZ']]
+    gyroLists = [session['gyroX'], session['gyroY'], session['gyroZ']]
+
+    _, _, batchTimes, batchPeaks = swingDetection(accelLists, gyroLists, timeList)
+    chunkBounds = [0] + list(range(firstChunk, len(timeList), 97)) + [len(timeList)]
+    streamed = streamSwings(timeList, accelLists, gyroLists, chunkBounds)
+
+    assert len(streamed) == len(batchTimes) == 5
+
+    # The running spacing estimate can differ from the whole-session mean by a rounding step
+    for (_, _, streamTime, streamPeak), batchTime, batchPeak in zip(streamed, batchTimes, batchPeaks):
+        assert abs(len(streamTime) - len(batchTime)) <= 2
+        assert abs(streamPeak - batchPeak) <= 2
+        assert abs(streamTime[streamPeak] - batchTime[batchPeak]) <= 2/sampleRate
+def test_streaming_matches_batch_with_live_sized_chunks():
+    # A few samples per push, as the live sources deliver them
+    session = synthesizeSession(seconds=40, sampleRate=1000.0, swingCount=5)
+    timeList = ticksToSeconds(session['timestamp'])
+    accelLists = [session['accelX'], session['accelY'], session['accelZ']]
+    gyroLists = [session['gyroX'], session['gyroY'], session['gyroZ']]
+
+    _, _, batchTimes, batchPeaks = swingDetection(accelLists, gyroLists, timeList)
+    streamed = streamSwings(timeList, accelLists, gyroLists, list(range(0, len(timeList), 4)) + [len(timeList)])
+
+    assert len(streamed) == len(batchTimes) == 5
+    for (_, _, streamTime, streamPeak), batchTime, batchPeak in zip(streamed, batchTimes, batchPeaks):
+        assert abs(len(streamTime) - len(batchTime)) <= 2
+        assert abs(streamTime[streamPeak] - batchTime[batchPeak]) <= 2/1000.0
+
+def cutLists(length):
+    samples = np.arange(length, dtype=float)
+    return [samples, samples, samples], [samples, samples, samples], samples, samples, samples
+
+def test_pair_peaks_without_peaks():
+    assert len(pairPeaks(np.array([], dtype=int), np.array([], dtype=int), 100)) == 0
+    assert len(pairPeaks(np.array([500]), np.array([], dtype=int), 100)) == 0
+
+def test_pair_peaks_drops_unmatched_gyro_peaks():
+    # gyro 5000 has no accel peak within half a window, gyro 1010 pairs with accel 1000
+    assert np.array_equal(pairPeaks(np.array([1000]), np.array([1010, 5000]), 100), [1005])
+    assert np.array_equal(pairPeaks(np.array([1000, 3000]), np.array([1010, 9000]), 100), [1005])
+
+def test_pair_peaks_at_first_sample():
+    peakList = pairPeaks(np.array([0]), np.array([0]), 100)
+    assert np.array_equal(peakList, [0])
+
+    # the window is clamped to start at the first sample
+    accel, gyro, time, peak = cutSwing(*cutLists(1000), peakList[0], 100)
+    assert len(time) == 50
+    assert peak == 0
+
+def test_pair_peaks_near_the_end():
+    peakList = pairPeaks(np.array([990]), np.array([994]), 100)
+    assert np.array_equal(peakList, [992])
+
+    # the window runs past the last sample and is cut short
+    accel, gyro, time, peak = cutSwing(*cutLists(1000), peakList[0], 100)
+    assert len(time) == len(accel[3]) == len(gyro[3]) == 58
+    assert time[peak] == 991
+
+@pytest.mark.parametrize("length", [0, 1])
+def test_swing_detection_without_samples(length):
+    # A file with no parseable rows reaches detection as empty columns
+    columns = [np.zeros(length)]*3
+    assert swingDetection(columns, columns, np.arange(length)*0.001) == ([], [], [], [])
@@ -1,11 +1,19 @@
 import sys
+import inspect
+import traceback
 from PyQt5.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
 
+from jobControl import CancelToken, JobCancelled
+import instrumentation
+
 class WorkerSignals(QObject):
     finished = pyqtSignal()
     error = pyqtSignal(tuple)
     result = pyqtSignal(object)
+    partial = pyqtSignal(object)
+    # fraction done, message, job finished
     progress = pyqtSignal(float, str, bool)
+    cancelled = pyqtSignal()
 
 class Worker(QRunnable):
     ## Constructor
@@ -17,21 +25,53 @@ class Worker(QRunnable):
         self.args = args
         self.kwargs = kwargs
         self.signals = WorkerSignals()
+        self.cancelToken = CancelToken()
+        self.spanName = f'worker.{getattr(fn, "__name__", type(fn).__name__)}'
+
+        # Functions that take these keywords get progress reporting and cooperative cancellation
+        try:
+            parameters = inspect.signature(fn).parameters
+        except (TypeError, ValueError):
+            parameters = {}
+
+        if ('progress_callback' in parameters):
+            self.kwargs['progress_callback'] = self.reportProgress
+        if ('cancel_token' in parameters):
+            self.kwargs['cancel_token'] = self.cancelToken
 
-#        self.kwargs['progress_callback'] = self.signals.progress
+    def reportProgress(self, fraction, message=''):
+        self.signals.progress.emit(float(fraction), message, False)
+
+    def cancel(self):
+        self.cancelToken.cancel()
 
     ## Initialise the runner function with passed args, kwargs.
     @pyqtSlot()
     def run(self):
         # Retrieve args/kwargs here; and fire processing using them
         try:
-            result = self.fn(*self.args, **self.kwargs)
+            with instrumentation.profiled(), instrumentation.span(self.spanName):
+                self.cancelToken.check()
+                result = self.fn(*self.args, **self.kwargs)
+
+                # Generators stream each item back as it is produced and are not kept, the result is the item count
+                if (inspect.isgenerator(result)):
+                    count = 0
+                    for item in result:
+                        self.cancelToken.check()
+                        count += 1
+                        self.signals.partial.emit(item)
+                    result = count
+
+                self.cancelToken.check()
+        except JobCancelled:
+            self.signals.cancelled.emit()
         except Exception as e:
-#            traceback.print_exc()
-            print(e)
-#            exctype, value = sys.exc_info()[:2]
-#            self.signals.error.emit((exctype, value, traceback.format_exc()))
+            traceback.print_exc()
+            exctype, value = sys.exc_info()[:2]
+            self.signals.error.emit((exctype, value, traceback.format_exc()))
         else:
             self.signals.result.emit(result)  # Return the result of the processing
         finally:
+            self.signals.progress.emit(1.0, '', True)
             self.signals.finished.emit()  # Done